@@ -1,105 +1,515 @@
 # -*- coding: utf-8 -*-
-
+import logging
+from operator import attrgetter
 from random import choice
-from copy import deepcopy
+from time import time
+
+from checkers.bitboard import Position, SQUARE_FIELDS, square
+from checkers.logic import DIRECTIONS, MovePath, apply_move_path, undo_move_path
+from checkers.models import Board, Checker
+from checkers.tablebase import RESULT
+from checkers.transposition import TranspositionTable
+
+# practical limit of fixed depth search in pure Python: depth 8 takes 0.5-3s per move in the middle game,
+# depth 10 takes 3-18s, so deeper search is given a time limit instead, see settings.AI_TIME_LIMIT
+DEFAULT_DEPTH = 8
 
-from checkers.logic import get_move, Move, get_available_moves_all_checkers
+MAN_SCORE = 100
+KING_SCORE = 300
+ADVANCE_SCORE = 2       # for every line a man has passed
+CENTER_SCORE = 0        # for every checker on CENTER fields
+MOBILITY_SCORE = 0      # for every quiet move, obligatory kicks are not taken into account
+FEATURES_NUMBER = 5     # men, kings, advance, center, mobility, see get_features and get_weights
+CENTER = frozenset((x, y) for x in xrange(2, Board.SIZE - 2) for y in xrange(2, Board.SIZE - 2)
+                   if Board.is_valid_field(x, y))
+WIN_SCORE = 100000      # minus plies to the win, so faster wins are preferred
+INFINITY = WIN_SCORE + 1
+MAX_PLY = 1000
+MAX_DEPTH = 64
+CHECK_TIME_NODES = 63       # check the budget once per this many nodes + 1
+MAX_PV_LENGTH = 20
 
-MAX_RECURSION = 3
+logger = logging.getLogger(__name__)
 
 
-def calculate_ai_move(board, ai_color, player_color):
-    results = minimax(board, ai_color, player_color)
-    result = choice(results)
-    for r in results:
-        print r
-    return result.move_coords[0]
+def calculate_ai_move(board, ai_color, player_color, depth=DEFAULT_DEPTH, random_choice=True,
+                      transposition_table=None, time_limit=None, node_limit=None, book=None, tablebase=None,
+                      trace_callback=None, parallel_search=None):
+    """
+    return [move_coords, ...] of the whole turn, move_coords = (x1, y1, x2, y2), or None if ai can't move
+    see search_ai_move for arguments
+    """
+    assert ai_color != player_color
+
+    result = search_ai_move(board, ai_color, depth, random_choice, transposition_table, time_limit, node_limit, book,
+                            tablebase, trace_callback, parallel_search)
+    return result.move.hops if result.move else None
 
 
-def minimax(board, ai_color, player_color, recursion_level=0):
+def search_ai_move(board, color, depth=DEFAULT_DEPTH, random_choice=True, transposition_table=None,
+                   time_limit=None, node_limit=None, book=None, tablebase=None, trace_callback=None,
+                   parallel_search=None):
     """
-    return (move_coords, result_tuple)
-    move_coords = (x1, y1, x2, y2)
-    result_tuple = (result, ai_kicks, -player_kicks)
+    Iterative deepening search, return SearchResult of the deepest completed iteration.
+    depth: maximal depth, None to search until time_limit or node_limit
+    random_choice: choose randomly between equally good moves, otherwise take the first one
+    transposition_table: pass the same table between moves of one game to reuse previous searches
+    time_limit: seconds for the search
+    node_limit: maximal number of visited positions
+    book: checkers.book.OpeningBook, its moves are played without search
+    tablebase: checkers.tablebase.Tablebase, positions found in it are not searched deeper
+    trace_callback: called with SearchStats after every completed iteration, e.g. log_search_stats
+    parallel_search: checkers.parallel.ParallelSearch to split root moves between its processes, workers have their
+    own transposition tables and the tablebase given to ParallelSearch, so transposition_table, tablebase and
+    trace_callback are not used
     """
-    recursion_level += 1
+    assert depth is not None or time_limit is not None or node_limit is not None
 
-    if recursion_level == MAX_RECURSION:
-        return [Result(Result.TYPE.UNKNOWN)]
+    if parallel_search is not None:
+        return parallel_search.iterative_deepening(board, color, depth or MAX_DEPTH, random_choice, time_limit,
+                                                   node_limit, book=book)
+
+    search = Search(board, transposition_table, time_limit, node_limit, book=book, tablebase=tablebase,
+                    trace_callback=trace_callback)
+    return search.iterative_deepening(color, depth or MAX_DEPTH, random_choice)
+
+
+class SearchResult(object):
+    """
+    move: MovePath to play or None
+    best_moves: [(MovePath, score), ...] equally good moves
+    stats: SearchStats of the last iteration if search is traced
+    """
+    __slots__ = ('move', 'score', 'depth', 'nodes', 'elapsed', 'best_moves', 'from_book', 'stats')
 
-    color = ai_color if recursion_level % 2 else player_color
+    def __init__(self, move=None, score=0, depth=0, nodes=0, elapsed=0.0, best_moves=(), from_book=False):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.best_moves = best_moves
+        self.from_book = from_book
+        self.stats = None
 
-    results = [
-        # (move_coords, result_tuple),
-    ]
+    def __str__(self):
+        if self.from_book:
+            return 'book move'
+        return 'score %d, depth %d, %d nodes in %.2fs' % (self.score, self.depth, self.nodes, self.elapsed)
 
-    for checker, available_fields in get_available_moves_all_checkers(board, color):
-        for field in available_fields:
-            board_copy = deepcopy(board)
 
-            move_coords = (checker.x, checker.y, field[0], field[1])
-            move = get_move(board_copy, checker, *field)
-            board_copy.move(*move_coords)
+class SearchStats(object):
+    """
+    Statistics of one completed iteration.
+    nodes, elapsed: from the start of search
+    branching_factor: nodes of this iteration / nodes of the previous one
+    principal_variation: [MovePath, ...] expected turns of both players taken from transposition table
+    """
+    __slots__ = ('depth', 'score', 'nodes', 'elapsed', 'iteration_nodes', 'iteration_elapsed', 'branching_factor',
+                 'cutoffs', 'table_hits', 'principal_variation')
 
-            winner = board_copy.get_winner()
-            if winner:
-                result_type = Result.TYPE.WIN if color == ai_color else Result.TYPE.LOSE
-                return [Result(result_type, (checker.x, checker.y, field[0], field[1]))]
+    def __init__(self, depth, score, nodes, elapsed, iteration_nodes, iteration_elapsed, branching_factor, cutoffs,
+                 table_hits, principal_variation):
+        self.depth = depth
+        self.score = score
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.iteration_nodes = iteration_nodes
+        self.iteration_elapsed = iteration_elapsed
+        self.branching_factor = branching_factor
+        self.cutoffs = cutoffs
+        self.table_hits = table_hits
+        self.principal_variation = principal_variation
 
-            turn_results = minimax(board_copy, ai_color, player_color, recursion_level)
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
 
-            turn = Result.TURN.NONE
-            if move.type == Move.TYPE.KICK:
-                turn = Result.TURN.AI_KICK if color == ai_color else Result.TURN.PLAYER_KICK
+    def __str__(self):
+        return ('depth %d, score %d, %d nodes in %.2fs (%.0f/s), branching %.1f, %d cutoffs, %d table hits, pv %s' %
+                (self.depth, self.score, self.nodes, self.elapsed, self.nodes_per_second, self.branching_factor,
+                 self.cutoffs, self.table_hits, ' '.join(str(move) for move in self.principal_variation)))
 
-            for result in turn_results:
-                result.add_turn(move_coords, turn)
-            results.extend(turn_results)
 
-    if not results:
-        return [Result(Result.TYPE.SKIP)]
+def log_search_stats(stats):
+    """
+    trace_callback writing to logger of this module
+    """
+    logger.debug('%s', stats)
 
-    good_results = [r for r in results if r.score_ai > r.score_player]
-    if good_results:
-        results = good_results
 
-    fn = max if color == ai_color else min
-    best_result = fn(results, key=lambda r: r.key())
-    best_results = [result for result in results if result.key() == best_result.key()]
-    return best_results
+class SearchTimeout(Exception):
+    """
+    Time or node budget of search is exhausted
+    """
 
 
-class Result(object):
-    class TYPE:
-        WIN = 4
-        UNKNOWN = 3
-        DRAW = 2
-        LOSE = 1
-        SKIP = 0
+class Search(object):
+    """
+    Alpha-beta search on board, moves are made and taken back in place.
+    """
 
-    class TURN:
-        AI_KICK = 1
-        PLAYER_KICK = -1
-        NONE = 0
+    def __init__(self, board, transposition_table=None, time_limit=None, node_limit=None, progress_callback=None,
+                 book=None, tablebase=None, trace_callback=None):
+        """
+        progress_callback: called with SearchResult after every completed iteration
+        book: checkers.book.OpeningBook
+        tablebase: checkers.tablebase.Tablebase
+        trace_callback: called with SearchStats after every completed iteration, statistics are collected only
+        if it is given
+        """
+        self.board = board
+        self.book = book
+        self.tablebase = tablebase
+        self.table = transposition_table or TranspositionTable()
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.progress_callback = progress_callback
+        self.trace_callback = trace_callback
+        self.nodes = 0
+        self.cutoffs = 0
+        self._start_time = None
+        self._deadline = None
+        self._stopped = False
 
-    def __init__(self, result_type, move_coords=None):
-        self.result_type = result_type
-        self.move_coords = []
-        self.score_ai = 0
-        self.score_player = 0
+    def stop(self):
+        """
+        Interrupt running search, it may be called from another thread.
+        """
+        self._stopped = True
 
-        if move_coords:
-            self.add_turn(move_coords, 0, 0)
+    def set_time_limit(self, time_limit):
+        """
+        Change time budget of search counted from its start, it may be called from another thread while search runs,
+        e.g. when pondering without limits becomes a search for the move to play.
+        """
+        self.time_limit = time_limit
+        if self._start_time is not None:
+            self._deadline = self._start_time + time_limit if time_limit is not None else None
 
-    def add_turn(self, move_coords, turn=None):
-        self.move_coords.insert(0, move_coords)
-        if turn == Result.TURN.AI_KICK:
-            self.score_ai += 1
-        elif turn == Result.TURN.PLAYER_KICK:
-            self.score_player += 1
+    def iterative_deepening(self, color, max_depth, random_choice=True):
+        """
+        Search with depth 1, 2, ... max_depth while budget allows, return SearchResult.
+        """
+        start_time = self._start_time = time()
+        self.nodes = 0
+        self.table.new_search()
+        self._deadline = start_time + self.time_limit if self.time_limit is not None else None
 
-    def key(self):
-        return self.result_type, self.score_ai, -self.score_player
+        moves = get_moves(self.board, color)
+        result = SearchResult(elapsed=time() - start_time)
+        if len(moves) == 1:
+            result.move = moves[0]
+            result.best_moves = [(moves[0], 0)]
+            return result
 
-    def __str__(self):
-        return '%d:%d:%d %s' % (self.result_type, self.score_ai, self.score_player, self.move_coords)
+        book_move = self.book.choose_move(self.board, color, moves) if self.book and moves else None
+        if book_move:
+            result.move = book_move
+            result.from_book = True
+            result.elapsed = time() - start_time
+            return result
+
+        stats = None
+        for depth in xrange(1, max_depth + 1):
+            iteration_start_time = time()
+            iteration_start_nodes = self.nodes
+            table_hits = self.table.hits
+            self.cutoffs = 0
+            try:
+                best_results = self.search_root(color, depth, random_choice)
+            except SearchTimeout:
+                break
+
+            if not best_results:
+                break
+
+            move, score = choice(best_results) if random_choice else best_results[0]
+            result = SearchResult(move, score, depth, self.nodes, time() - start_time, best_results)
+            if self.trace_callback:
+                previous_nodes = stats.iteration_nodes if stats else 1
+                iteration_nodes = self.nodes - iteration_start_nodes
+                stats = SearchStats(depth, score, self.nodes, result.elapsed, iteration_nodes,
+                                    time() - iteration_start_time, float(iteration_nodes) / previous_nodes,
+                                    self.cutoffs, self.table.hits - table_hits,
+                                    self.get_principal_variation(color, move))
+                result.stats = stats
+                self.trace_callback(stats)
+            if self.progress_callback:
+                self.progress_callback(result)
+
+            if abs(score) > WIN_SCORE - MAX_PLY:
+                break
+
+        if result.move is None and moves:
+            # not even first iteration is completed
+            result.move = moves[0]
+
+        result.nodes = self.nodes
+        result.elapsed = time() - start_time
+        return result
+
+    def search_root(self, color, depth, all_best=False):
+        """
+        return [(MovePath, score), ...] of the best moves
+        all_best: return every move with the best score, not only the first one
+        """
+        best_score = -INFINITY
+        best_results = []
+
+        # best move of the previous iteration is stored in table and goes first
+        for move in self._order_moves(get_moves(self.board, color), self._get_hash_move(color)):
+            # when collecting equal moves the window must include best_score to get exact scores for them
+            alpha = best_score - 1 if all_best else best_score
+            score = self.search_move(color, move, depth, alpha)
+
+            if score > best_score:
+                best_score = score
+                best_results = [(move, score)]
+            elif all_best and score == best_score:
+                best_results.append((move, score))
+
+        if best_results:
+            self.table.store(self.board.get_hash(color), depth, TranspositionTable.BOUND.EXACT,
+                             best_score, pack_path(best_results[0][0].path))
+        return best_results
+
+    def negamax(self, color, depth, alpha, beta, ply=0):
+        """
+        return score of position for color, fail-hard inside (alpha, beta) window
+        depth is counted in turns, search goes on while kicks are available
+        """
+        self.nodes += 1
+        if not self.nodes & CHECK_TIME_NODES:
+            self._check_budget()
+
+        if self.tablebase:
+            tablebase_result = self.tablebase.probe(self.board, color)
+            if tablebase_result:
+                return min(max(_score_from_tablebase(tablebase_result, ply), alpha), beta)
+
+        key = self.board.get_hash(color)
+        entry = self.table.probe(key)
+        hash_move = None
+        if entry:
+            hash_move = unpack_path(entry.move)
+            if entry.depth >= depth:
+                score = _score_from_table(entry.score, ply)
+                if entry.bound == TranspositionTable.BOUND.EXACT:
+                    return min(max(score, alpha), beta)
+                if entry.bound == TranspositionTable.BOUND.LOWER and score >= beta:
+                    return beta
+                if entry.bound == TranspositionTable.BOUND.UPPER and score <= alpha:
+                    return alpha
+
+        moves = get_moves(self.board, color)
+        if not moves:
+            return -WIN_SCORE + ply
+
+        if depth <= 0 and not moves[0].is_kick:
+            return evaluate(self.board, color)
+
+        best_move = None
+        for move in self._order_moves(moves, hash_move):
+            score = self._search_child(color, move, depth, ply + 1, alpha, beta)
+            if score >= beta:
+                self.cutoffs += 1
+                self.table.store(key, depth, TranspositionTable.BOUND.LOWER, _score_to_table(beta, ply),
+                                 pack_path(move.path))
+                return beta
+            if score > alpha:
+                alpha = score
+                best_move = pack_path(move.path)
+
+        bound = TranspositionTable.BOUND.EXACT if best_move else TranspositionTable.BOUND.UPPER
+        self.table.store(key, depth, bound, _score_to_table(alpha, ply), best_move)
+        return alpha
+
+    def search_move(self, color, move, depth, alpha=-INFINITY):
+        """
+        return score of root MovePath for color, exact if greater than alpha
+        """
+        return self._search_child(color, move, depth, 1, alpha, INFINITY)
+
+    def _search_child(self, color, move, depth, ply, alpha, beta):
+        undo_tokens = apply_move_path(self.board, move)
+        try:
+            return -self.negamax(opponent_color(color), depth - 1, -beta, -alpha, ply)
+        finally:
+            undo_move_path(self.board, undo_tokens)
+
+    def get_principal_variation(self, color, move, max_length=MAX_PV_LENGTH):
+        """
+        return [move, MovePath, ...] starting with root move and following best moves stored in table
+        """
+        principal_variation = []
+        undo_tokens = []
+        keys = set()
+        while move is not None and len(principal_variation) < max_length:
+            principal_variation.append(move)
+            undo_tokens.append(apply_move_path(self.board, move))
+            color = opponent_color(color)
+
+            key = self.board.get_hash(color)
+            entry = self.table.probe(key)
+            if key in keys or not entry or entry.move is None:
+                break
+            keys.add(key)
+            path = unpack_path(entry.move)
+            move = next((next_move for next_move in get_moves(self.board, color) if next_move.path == path), None)
+
+        for undo_token in reversed(undo_tokens):
+            undo_move_path(self.board, undo_token)
+        return principal_variation
+
+    def _check_budget(self):
+        if self._stopped:
+            raise SearchTimeout()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time() >= self._deadline:
+            raise SearchTimeout()
+
+    def _get_hash_move(self, color):
+        entry = self.table.probe(self.board.get_hash(color))
+        return unpack_path(entry.move) if entry else None
+
+    @staticmethod
+    def _order_moves(moves, hash_move):
+        """
+        hash_move: path of MovePath to try first
+        """
+        if hash_move is None:
+            return moves
+        return sorted(moves, key=lambda move: move.path != hash_move)
+
+
+def _score_to_table(score, ply):
+    # win scores are stored relative to the node, not to the root
+    if score > WIN_SCORE - MAX_PLY:
+        return score + ply
+    if score < -WIN_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    if score > WIN_SCORE - MAX_PLY:
+        return score - ply
+    if score < -WIN_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def _score_from_tablebase(tablebase_result, ply):
+    result, distance = tablebase_result
+    if result == RESULT.WIN:
+        return WIN_SCORE - ply - distance
+    if result == RESULT.LOSS:
+        return -WIN_SCORE + ply + distance
+    return 0
+
+
+def get_moves(board, color):
+    """
+    return [MovePath, ...] in the order of checkers.logic.get_available_move_paths, generated on bit masks kept
+    by board, see checkers.bitboard
+    """
+    move_paths = [MovePath([SQUARE_FIELDS[sq] for sq in path], [SQUARE_FIELDS[sq] for sq in captured], becomes_king)
+                  for path, captured, becomes_king in Position(*board.get_masks()).get_turns(color)]
+    # kick chains of logic are searched depth-first with sorted fields, so its order is the order of paths
+    move_paths.sort(key=attrgetter('path'))
+    return move_paths
+
+
+def pack_path(path):
+    """
+    return int of MovePath.path fields, 5 bits per field after a leading 1 bit, stored in transposition table
+    instead of the path tuple to keep entries small
+    """
+    packed = 1
+    for x, y in path:
+        packed = packed << 5 | square(x, y)
+    return packed
+
+
+def unpack_path(packed):
+    """
+    return MovePath.path packed by pack_path, None for None
+    """
+    if packed is None:
+        return None
+
+    path = []
+    while packed > 1:
+        path.append(SQUARE_FIELDS[packed & 31])
+        packed >>= 5
+    return tuple(reversed(path))
+
+
+def evaluate(board, color):
+    """
+    Static score of position for color, the same as score_features(get_features(board), color).
+    """
+    if CENTER_SCORE or MOBILITY_SCORE:
+        return score_features(get_features(board), color)
+
+    # counters are kept by board, so score doesn't depend on checkers number
+    opponent = opponent_color(color)
+    return (MAN_SCORE * (board.get_checkers_number(color, False) - board.get_checkers_number(opponent, False)) +
+            KING_SCORE * (board.get_checkers_number(color, True) - board.get_checkers_number(opponent, True)) +
+            ADVANCE_SCORE * (board.get_men_advance(color) - board.get_men_advance(opponent)))
+
+
+def get_features(board):
+    """
+    return (men, kings, advance, center, mobility), every feature is value for white minus value for black
+    """
+    features = [0] * FEATURES_NUMBER
+    for checker in board.checkers:
+        sign = 1 if checker.color == Checker.WHITE else -1
+        if checker.is_king:
+            features[1] += sign
+        else:
+            features[0] += sign
+            features[2] += sign * (checker.y if checker.color == Checker.WHITE else board.SIZE - 1 - checker.y)
+        if (checker.x, checker.y) in CENTER:
+            features[3] += sign
+        features[4] += sign * _count_quiet_moves(board, checker)
+    return tuple(features)
+
+
+def get_weights():
+    """
+    return weights of get_features, taken from the score constants when called, so changed constants are used
+    """
+    return MAN_SCORE, KING_SCORE, ADVANCE_SCORE, CENTER_SCORE, MOBILITY_SCORE
+
+
+def score_features(features, color, weights=None):
+    """
+    weights: get_weights() by default
+    """
+    if weights is None:
+        weights = get_weights()
+    score = sum(feature * weight for feature, weight in zip(features, weights))
+    return score if color == Checker.WHITE else -score
+
+
+def _count_quiet_moves(board, checker):
+    forward = 1 if checker.color == Checker.WHITE else -1
+    moves = 0
+    for dx, dy in DIRECTIONS:
+        if not checker.is_king and dy != forward:
+            continue
+        x, y = checker.x + dx, checker.y + dy
+        while board.is_valid_field(x, y) and not board.get_checker_in_position(x, y):
+            moves += 1
+            if not checker.is_king:
+                break
+            x, y = x + dx, y + dy
+    return moves
+
+
+def opponent_color(color):
+    return Checker.BLACK if color == Checker.WHITE else Checker.WHITE
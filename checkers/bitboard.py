@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Bitboard representation of a position.
+
+Only dark fields are playable, so a position is three 32-bit masks: white checkers, black checkers and kings.
+Field (x, y) is bit ``y * 4 + x // 2``: a1 is bit 0, h8 is bit 31.
+
+Moves follow the same rules as checkers.logic: men move forward and kick in every direction, kings fly along
+diagonals, kicking is obligatory.
+"""
+from checkers.models import Board, Checker
+from checkers.serialization import load_board, save_board
+
+SQUARES = Board.SIZE * Board.SIZE // 2
+FULL_MASK = (1 << SQUARES) - 1
+
+# (dx, dy) of every diagonal direction
+DIRECTIONS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+OPPOSITE = (3, 2, 1, 0)
+FORWARD = {
+    Checker.WHITE: (0, 1),
+    Checker.BLACK: (2, 3),
+}
+
+
+def square(x, y):
+    return y * (Board.SIZE // 2) + x // 2
+
+
+def square_coords(sq):
+    y = sq // (Board.SIZE // 2)
+    return 2 * (sq % (Board.SIZE // 2)) + y % 2, y
+
+
+SQUARE_FIELDS = tuple(square_coords(sq) for sq in xrange(SQUARES))     # SQUARE_FIELDS[sq] -> (x, y)
+
+
+def iter_squares(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _build_tables():
+    neighbours = []     # neighbours[direction][sq] -> sq or None
+    rays = []           # rays[direction][sq] -> (sq, ...) up to the board edge
+    shifts = []         # shifts[direction] -> ((source_mask, shift), ...)
+    for dx, dy in DIRECTIONS:
+        direction_neighbours = []
+        direction_rays = []
+        masks = {}
+        for sq in xrange(SQUARES):
+            x, y = square_coords(sq)
+            ray = []
+            nx, ny = x + dx, y + dy
+            while Board.is_valid_field(nx, ny):
+                ray.append(square(nx, ny))
+                nx, ny = nx + dx, ny + dy
+            direction_rays.append(tuple(ray))
+            direction_neighbours.append(ray[0] if ray else None)
+            if ray:
+                shift = ray[0] - sq
+                masks[shift] = masks.get(shift, 0) | 1 << sq
+        neighbours.append(tuple(direction_neighbours))
+        rays.append(tuple(direction_rays))
+        shifts.append(tuple((mask, shift) for shift, mask in sorted(masks.items())))
+    return tuple(neighbours), tuple(rays), tuple(shifts)
+
+
+NEIGHBOURS, RAYS, SHIFTS = _build_tables()
+
+KING_LINE = {
+    Checker.WHITE: sum(1 << square(x, Board.SIZE - 1) for x in xrange(Board.SIZE) if Board.is_valid_field(x, Board.SIZE - 1)),
+    Checker.BLACK: sum(1 << square(x, 0) for x in xrange(Board.SIZE) if Board.is_valid_field(x, 0)),
+}
+
+
+def shift(mask, direction):
+    """
+    Move every bit of mask one step in direction, bits leaving the board are dropped.
+    """
+    result = 0
+    for source_mask, offset in SHIFTS[direction]:
+        part = mask & source_mask
+        if offset > 0:
+            result |= part << offset
+        else:
+            result |= part >> -offset
+    return result
+
+
+class Position(object):
+    """
+    Immutable position, moves are (from_sq, to_sq, victim_sq or None) tuples.
+    """
+    __slots__ = ('white', 'black', 'kings')
+
+    def __init__(self, white=0, black=0, kings=0):
+        self.white = white
+        self.black = black
+        self.kings = kings
+
+    @classmethod
+    def from_board(cls, board):
+        # masks are kept by board, see Board.get_masks
+        return cls(*board.get_masks())
+
+    @classmethod
+    def from_json(cls, data):
+        return cls.from_board(load_board(data))
+
+    def to_board(self):
+        board = Board()
+        for color in (Checker.WHITE, Checker.BLACK):
+            for sq in iter_squares(self.pieces(color)):
+                checker = Checker(color, *square_coords(sq))
+                if self.kings & 1 << sq:
+                    checker.make_king()
+                board.add_checker(checker)
+        return board
+
+    def to_json(self):
+        return save_board(self.to_board())
+
+    @property
+    def empty(self):
+        return FULL_MASK & ~(self.white | self.black)
+
+    def pieces(self, color):
+        return self.white if color == Checker.WHITE else self.black
+
+    def color_at(self, sq):
+        bit = 1 << sq
+        if self.white & bit:
+            return Checker.WHITE
+        if self.black & bit:
+            return Checker.BLACK
+        return None
+
+    def get_moves(self, color):
+        """
+        Return all legal moves for color, only kicks if any kick is possible.
+        """
+        kicks = self._get_kicks(color)
+        if kicks:
+            return kicks
+        return self._get_quiet_moves(color)
+
+    def _get_kicks(self, color):
+        own = self.pieces(color)
+        opponent = self.black if color == Checker.WHITE else self.white
+        empty = self.empty
+        men = own & ~self.kings
+        kicks = []
+
+        for direction in xrange(len(DIRECTIONS)):
+            back = NEIGHBOURS[OPPOSITE[direction]]
+            victims = shift(men, direction) & opponent
+            for to_sq in iter_squares(shift(victims, direction) & empty):
+                victim_sq = back[to_sq]
+                kicks.append((back[victim_sq], to_sq, victim_sq))
+
+        for from_sq in iter_squares(own & self.kings):
+            for ray in (RAYS[direction][from_sq] for direction in xrange(len(DIRECTIONS))):
+                victim_sq = None
+                for sq in ray:
+                    bit = 1 << sq
+                    if empty & bit:
+                        if victim_sq is not None:
+                            kicks.append((from_sq, sq, victim_sq))
+                    elif victim_sq is None and opponent & bit:
+                        victim_sq = sq
+                    else:
+                        break
+        return kicks
+
+    def _get_quiet_moves(self, color):
+        own = self.pieces(color)
+        empty = self.empty
+        men = own & ~self.kings
+        moves = []
+
+        for direction in FORWARD[color]:
+            back = NEIGHBOURS[OPPOSITE[direction]]
+            for to_sq in iter_squares(shift(men, direction) & empty):
+                moves.append((back[to_sq], to_sq, None))
+
+        for from_sq in iter_squares(own & self.kings):
+            for direction in xrange(len(DIRECTIONS)):
+                for sq in RAYS[direction][from_sq]:
+                    if not empty & 1 << sq:
+                        break
+                    moves.append((from_sq, sq, None))
+        return moves
+
+    def get_move_paths(self, color):
+        """
+        Return [(path, position after turn), ...] where path is squares of checker from start to end.
+        Kick chains are followed to the end as in checkers.logic.get_available_move_paths.
+        """
+        kicks = self._get_kicks(color)
+        if not kicks:
+            return [((move[0], move[1]), self.apply(move)) for move in self._get_quiet_moves(color)]
+
+        move_paths = []
+        for move in kicks:
+            self._add_kick_paths(color, move, [move[0]], move_paths)
+        return move_paths
+
+    def get_turns(self, color):
+        """
+        Return [(path, captured, becomes_king), ...] of the same turns as get_move_paths, captured is squares
+        of kicked checkers. Positions after quiet moves are not created.
+        """
+        kicks = self._get_kicks(color)
+        if not kicks:
+            kings = self.kings
+            promotion_line = KING_LINE[color]
+            return [((from_sq, to_sq), (), not kings & 1 << from_sq and bool(promotion_line & 1 << to_sq))
+                    for from_sq, to_sq, _ in self._get_quiet_moves(color)]
+
+        turns = []
+        for move in kicks:
+            self._add_kick_turns(color, move, [move[0]], [], not self.kings & 1 << move[0], turns)
+        return turns
+
+    def _add_kick_turns(self, color, move, path, captured, was_man, turns):
+        position = self.apply(move)
+        path.append(move[1])
+        captured.append(move[2])
+        next_kicks = [next_move for next_move in position._get_kicks(color) if next_move[0] == move[1]]
+        if next_kicks:
+            for next_move in next_kicks:
+                position._add_kick_turns(color, next_move, path, captured, was_man, turns)
+        else:
+            turns.append((tuple(path), tuple(captured), was_man and bool(position.kings & 1 << move[1])))
+        captured.pop()
+        path.pop()
+
+    def _add_kick_paths(self, color, move, path, move_paths):
+        position = self.apply(move)
+        path.append(move[1])
+        next_kicks = [next_move for next_move in position._get_kicks(color) if next_move[0] == move[1]]
+        if next_kicks:
+            for next_move in next_kicks:
+                position._add_kick_paths(color, next_move, path, move_paths)
+        else:
+            move_paths.append((tuple(path), position))
+        path.pop()
+
+    def flipped(self):
+        """
+        Return position turned by 180 degrees with swapped colors, the same for the other player.
+        """
+        return Position(reverse_squares(self.black), reverse_squares(self.white), reverse_squares(self.kings))
+
+    def apply(self, move):
+        """
+        Return new position after move, captured checker is removed and man reaching the last line becomes king.
+        """
+        from_sq, to_sq, victim_sq = move
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+        white, black, kings = self.white, self.black, self.kings
+
+        if white & from_bit:
+            white ^= from_bit | to_bit
+            promotion_line = KING_LINE[Checker.WHITE]
+        else:
+            black ^= from_bit | to_bit
+            promotion_line = KING_LINE[Checker.BLACK]
+
+        if kings & from_bit or promotion_line & to_bit:
+            kings = kings & ~from_bit | to_bit
+
+        if victim_sq is not None:
+            victim_mask = ~(1 << victim_sq)
+            white &= victim_mask
+            black &= victim_mask
+            kings &= victim_mask
+
+        return Position(white, black, kings)
+
+    def __reduce__(self):
+        return Position, (self.white, self.black, self.kings)
+
+    def __eq__(self, other):
+        return (isinstance(other, Position) and
+                (self.white, self.black, self.kings) == (other.white, other.black, other.kings))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.white, self.black, self.kings))
+
+    def __repr__(self):
+        return 'Position(0x%08x, 0x%08x, 0x%08x)' % (self.white, self.black, self.kings)
+
+
+_REVERSED_BYTES = [int('{0:08b}'.format(byte)[::-1], 2) for byte in xrange(256)]
+
+
+def reverse_squares(mask):
+    """
+    Square sq goes to SQUARES - 1 - sq, that is field (x, y) goes to (SIZE - 1 - x, SIZE - 1 - y).
+    """
+    return (_REVERSED_BYTES[mask & 0xff] << 24 | _REVERSED_BYTES[mask >> 8 & 0xff] << 16 |
+            _REVERSED_BYTES[mask >> 16 & 0xff] << 8 | _REVERSED_BYTES[mask >> 24 & 0xff])
+
+
+def get_available_moves_all_checkers(position, color):
+    """
+    Same as checkers.logic.get_available_moves_all_checkers but with fields instead of checkers:
+    [((x1, y1), [(x2, y2), ...]), ...]
+    """
+    fields = {}
+    for from_sq, to_sq, _ in position.get_moves(color):
+        fields.setdefault(from_sq, []).append(square_coords(to_sq))
+    return [(square_coords(from_sq), sorted(fields[from_sq])) for from_sq in sorted(fields)]
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Opening book: best moves of positions near the start position, found offline by deep search.
+
+Book file is a header and records sorted by position hash (Board.get_hash), one record per book move:
+    key: uint64, weight: uint16, path length: uint8, path: MAX_PATH_LENGTH fields as bitboard squares
+The file is memory-mapped and searched by binary search, so it is never loaded whole.
+
+Usage:
+    python -m checkers.book build boards/default.json boards/default.book --plies 4 --depth 8
+    python -m checkers.book info boards/default.book
+"""
+import argparse
+import mmap
+import struct
+from random import randint
+from time import time
+
+from checkers.ai import Search, DEFAULT_DEPTH, INFINITY, get_moves, opponent_color
+from checkers.bitboard import square, square_coords
+from checkers.logic import apply_move_path, undo_move_path
+from checkers.models import Checker
+from checkers.serialization import load_board_from_file
+from checkers.transposition import TranspositionTable
+
+MAGIC = 'CHKBOOK1'
+HEADER = struct.Struct('<8sIHH')     # magic, records number, plies, depth
+MAX_PATH_LENGTH = 12
+RECORD = struct.Struct('<QHB%dB' % MAX_PATH_LENGTH)
+KEY = struct.Struct('<Q')
+
+DEFAULT_PLIES = 4
+DEFAULT_MARGIN = 10     # moves worse than the best one by at most this score are book moves too
+
+
+class BookError(Exception):
+    """
+    Wrong book file
+    """
+
+
+class OpeningBook(object):
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.size, self.plies, self.depth = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or len(self._map) != HEADER.size + self.size * RECORD.size:
+            raise BookError('%s is not an opening book.' % filename)
+
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        """
+        return [(path, weight), ...] of position
+        """
+        index = self._find_first(key)
+        moves = []
+        while index < self.size:
+            record = RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+            if record[0] != key:
+                break
+            weight, path_length = record[1], record[2]
+            moves.append((tuple(square_coords(sq) for sq in record[3:3 + path_length]), weight))
+            index += 1
+        return moves
+
+    def choose_move(self, board, color, moves):
+        """
+        return MovePath from moves chosen randomly by book weights or None if position isn't in book
+        """
+        moves_by_path = dict((move.path, move) for move in moves)
+        book_moves = [(path, weight) for path, weight in self.probe(board.get_hash(color)) if path in moves_by_path]
+        if not book_moves:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        value = randint(1, sum(weight for _, weight in book_moves))
+        for path, weight in book_moves:
+            value -= weight
+            if value <= 0:
+                return moves_by_path[path]
+
+    @property
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return float(self.hits) / probes if probes else 0.0
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _find_first(self, key):
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self._map, HEADER.size + middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __str__(self):
+        return 'book: %d moves, %d plies, depth %d, hit rate %.0f%%' % (self.size, self.plies, self.depth,
+                                                                        self.hit_rate * 100)
+
+
+def build_book(board, color, plies=DEFAULT_PLIES, depth=DEFAULT_DEPTH, margin=DEFAULT_MARGIN):
+    """
+    Search every position reachable in plies turns from board.
+    return {key: [(path, weight), ...]}
+    """
+    entries = {}
+    table = TranspositionTable()
+    _add_book_entries(board, color, plies, depth, margin, table, entries)
+    return entries
+
+
+def _add_book_entries(board, color, plies, depth, margin, table, entries):
+    key = board.get_hash(color)
+    if plies <= 0 or key in entries:
+        return
+
+    search = Search(board, table)
+    table.new_search()
+    scores = []
+    best_score = -INFINITY
+    for move in get_moves(board, color):
+        # moves which can't get into margin are cut off, their scores aren't exact
+        score = search.search_move(color, move, depth, max(best_score - margin - 1, -INFINITY))
+        scores.append((move, score))
+        best_score = max(best_score, score)
+
+    entries[key] = [(move.path, margin + 1 - (best_score - score)) for move, score in scores
+                    if score >= best_score - margin]
+
+    for move, _ in scores:
+        undo_tokens = apply_move_path(board, move)
+        _add_book_entries(board, opponent_color(color), plies - 1, depth, margin, table, entries)
+        undo_move_path(board, undo_tokens)
+
+
+def write_book(filename, entries, plies, depth):
+    records = sorted((key, -weight, path) for key, moves in entries.iteritems() for path, weight in moves
+                     if len(path) <= MAX_PATH_LENGTH)
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), plies, depth))
+        for key, negative_weight, path in records:
+            squares = [square(x, y) for x, y in path]
+            squares.extend([0] * (MAX_PATH_LENGTH - len(squares)))
+            f.write(RECORD.pack(key, -negative_weight, len(path), *squares))
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or inspect opening book.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    build_parser = subparsers.add_parser('build')
+    build_parser.add_argument('board')
+    build_parser.add_argument('book')
+    build_parser.add_argument('--color', default=Checker.WHITE, choices=[Checker.WHITE, Checker.BLACK])
+    build_parser.add_argument('--plies', type=int, default=DEFAULT_PLIES)
+    build_parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    build_parser.add_argument('--margin', type=int, default=DEFAULT_MARGIN)
+
+    info_parser = subparsers.add_parser('info')
+    info_parser.add_argument('book')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start_time = time()
+        entries = build_book(load_board_from_file(args.board), args.color, args.plies, args.depth, args.margin)
+        records_number = write_book(args.book, entries, args.plies, args.depth)
+        print '%d positions, %d moves, built in %.1fs' % (len(entries), records_number, time() - start_time)
+    else:
+        book = OpeningBook(args.book)
+        print book
+        book.close()
+
+
+if __name__ == '__main__':
+    main()
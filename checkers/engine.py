@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Headless engine process: commands are read line by line from stdin, results are written to stdout.
+Transposition table, book and tablebase are kept open between commands, so the process is started once
+and reused for many searches.
+
+Commands:
+    newgame                         clear transposition table, set the default position with white to move
+    position white|black [JSON]     set position, JSON board as in checkers.serialization on one line,
+                                    the default position if it is omitted
+    go [depth N] [time S] [nodes N] search current position in background, depth DEFAULT_DEPTH if nothing is given
+    stop                            interrupt search, best move of the deepest completed iteration is written
+    quit                            stop search and exit
+Commands changing position or starting a new search stop the running one first, end of input waits for it.
+
+Output lines:
+    info depth D score S nodes N time T pv c3-d4 f6-e5 ...     after every completed iteration
+    bestmove c3-d4 score S depth D nodes N time T               or "bestmove none" if there are no moves
+    error MESSAGE
+
+Usage: python -m checkers.engine --book boards/default.book --tablebase tablebase
+"""
+import argparse
+import json
+import sys
+import threading
+
+from checkers.ai import Search, DEFAULT_DEPTH, MAX_DEPTH
+from checkers.book import OpeningBook
+from checkers.logic import Game
+from checkers.models import BoardError, Checker
+from checkers.serialization import load_board, load_board_from_file
+from checkers.tablebase import Tablebase
+from checkers.transposition import TranspositionTable, DEFAULT_MAX_MEMORY
+
+DEFAULT_BOARD_FILENAME = 'boards/default.json'
+
+
+class EngineError(Exception):
+    """
+    Wrong engine command
+    """
+
+
+class EngineSession(object):
+    """
+    State of engine process between commands, search runs in a separate thread so it can be stopped.
+    """
+
+    def __init__(self, output=sys.stdout, book=None, tablebase=None, table_memory=DEFAULT_MAX_MEMORY):
+        self.output = output
+        self.book = book
+        self.tablebase = tablebase
+        self.table = TranspositionTable(table_memory)   # shared by searches until the next game
+        self.game = None
+        self._search = None
+        self._search_thread = None
+        self._output_lock = threading.Lock()
+
+        self.commands = {
+            'newgame': self.new_game,
+            'position': self.set_position,
+            'go': self.go,
+            'stop': self.stop,
+        }
+        self.new_game()
+
+    def execute(self, line):
+        """
+        Run one command line, return False after quit.
+        """
+        words = line.split(None, 1)
+        if not words:
+            return True
+
+        command, arguments = words[0], words[1] if len(words) > 1 else ''
+        if command == 'quit':
+            self.stop()
+            return False
+
+        try:
+            if command not in self.commands:
+                raise EngineError('Unknown command %r.' % command)
+            self.commands[command](arguments)
+        except (EngineError, BoardError, KeyError, ValueError), e:
+            self.write('error %s' % e)
+        return True
+
+    def new_game(self, arguments=''):
+        self.stop()
+        self.table.clear()
+        self.game = Game(DEFAULT_BOARD_FILENAME)
+
+    def set_position(self, arguments):
+        self.stop()
+        words = arguments.split(None, 1)
+        if not words or words[0] not in (Checker.WHITE, Checker.BLACK):
+            raise EngineError('Color to move is expected.')
+
+        color = words[0]
+        if len(words) > 1:
+            board = load_board(parse_checkers(words[1]))
+        else:
+            board = load_board_from_file(DEFAULT_BOARD_FILENAME)
+        self.game = Game(board=board, color=color)
+
+    def go(self, arguments):
+        self.stop()
+        limits = {'depth': None, 'time': None, 'nodes': None}
+        words = arguments.split()
+        if len(words) % 2:
+            raise EngineError('Limit value is expected.')
+        for name, value in zip(words[::2], words[1::2]):
+            if name not in limits:
+                raise EngineError('Unknown limit %r.' % name)
+            limits[name] = float(value) if name == 'time' else int(value)
+
+        depth = limits['depth']
+        if depth is None:
+            depth = MAX_DEPTH if limits['time'] is not None or limits['nodes'] is not None else DEFAULT_DEPTH
+
+        # search makes moves on board in place, so game is not replaced while it runs, see stop
+        self._search = Search(self.game.board, self.table, limits['time'], limits['nodes'], book=self.book,
+                              tablebase=self.tablebase, trace_callback=self._write_info)
+        self._search_thread = threading.Thread(target=self._run_search,
+                                               args=(self._search, self.game.current_player.color, depth))
+        self._search_thread.daemon = True
+        self._search_thread.start()
+
+    def stop(self, arguments=''):
+        """
+        Interrupt running search and wait for its best move.
+        """
+        if self._search_thread:
+            self._search.stop()
+            self.wait()
+
+    def wait(self):
+        """
+        Wait until running search is finished by its limits.
+        """
+        if self._search_thread:
+            self._search_thread.join()
+            self._search = None
+            self._search_thread = None
+
+    def _run_search(self, search, color, depth):
+        result = search.iterative_deepening(color, depth, random_choice=False)
+        if result.move is None:
+            self.write('bestmove none')
+        else:
+            self.write('bestmove %s score %d depth %d nodes %d time %.3f' % (
+                result.move, result.score, result.depth, result.nodes, result.elapsed))
+
+    def _write_info(self, stats):
+        self.write('info depth %d score %d nodes %d time %.3f pv %s' % (
+            stats.depth, stats.score, stats.nodes, stats.elapsed,
+            ' '.join(str(move) for move in stats.principal_variation)))
+
+    def write(self, line):
+        with self._output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+
+def parse_checkers(text):
+    """
+    return checkers list of JSON board, EngineError if JSON has another shape
+    """
+    data = json.loads(text)
+    checkers = data.get('checkers') if isinstance(data, dict) else None
+    if not isinstance(checkers, list):
+        raise EngineError('Board object with checkers list is expected.')
+
+    for checker_data in checkers:
+        if not isinstance(checker_data, dict) or not all(
+                type(checker_data.get(key)) is int for key in ('x', 'y')):
+            raise EngineError('Checker object with integer x and y is expected, got %s.' % json.dumps(checker_data))
+    return checkers
+
+
+def run(session, input=sys.stdin):
+    # readline instead of iteration, file iterator of python 2 reads ahead and waits for more lines
+    for line in iter(input.readline, ''):
+        if not session.execute(line):
+            return
+    session.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Engine process reading commands from stdin.')
+    parser.add_argument('--book', default=None)
+    parser.add_argument('--tablebase', default=None)
+    parser.add_argument('--table-memory', type=int, default=DEFAULT_MAX_MEMORY // (1024 * 1024),
+                        help='transposition table size in MB')
+    args = parser.parse_args()
+
+    book = OpeningBook(args.book) if args.book else None
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    run(EngineSession(sys.stdout, book, tablebase, args.table_memory * 1024 * 1024))
+
+
+if __name__ == '__main__':
+    main()
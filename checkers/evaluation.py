@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Batched evaluation with NumPy: the same features and scores as checkers.ai.get_features and
+checkers.ai.evaluate, computed for many positions at once.
+
+Positions are encoded as (N, SQUARES) int8 array in bitboard square order: WHITE_MAN, WHITE_KING, BLACK_MAN,
+BLACK_KING or EMPTY. All arithmetic is integer, so scores are equal to scalar ones exactly.
+
+Batches pay off from tens of positions: 50 positions take 0.8ms against 2.9ms of checkers.ai.get_features. Leaves of
+one search node are too few, evaluate_moves of 7 moves takes as long as scalar features because of applying moves
+and encoding, and default weights are scored from Board counters 5 times faster, so the search evaluates leaves
+one by one. Batches are for bulk evaluation of positions, e.g. records files.
+
+Usage: python -m checkers.evaluation boards/default.json --depth 4
+"""
+import argparse
+from time import time
+
+import numpy
+
+from checkers.ai import CENTER, FEATURES_NUMBER, evaluate, get_features, get_weights
+from checkers.bitboard import Position, SQUARES, RAYS, FORWARD, DIRECTIONS, square, square_coords
+from checkers.logic import apply_move_path, undo_move_path
+from checkers.models import Board, Checker
+from checkers.serialization import load_board_from_file
+
+EMPTY = 0
+WHITE_MAN = 1
+WHITE_KING = 2
+BLACK_MAN = -1
+BLACK_KING = -2
+_OFF_BOARD = 3      # value of padding square, neighbour of squares at the board edge
+
+_BITS = numpy.arange(SQUARES, dtype=numpy.uint32)
+_LINES = numpy.array([square_coords(sq)[1] for sq in xrange(SQUARES)], dtype=numpy.int64)
+_CENTER = numpy.zeros(SQUARES, dtype=bool)
+_CENTER[[square(x, y) for x, y in CENTER]] = True
+
+
+def _neighbour_index(sq, direction, step=0):
+    ray = RAYS[direction][sq]
+    return ray[step] if step < len(ray) else SQUARES
+
+
+# [direction][step] -> (SQUARES,) index of square step + 1 squares away, SQUARES if it is off board
+_RAY_INDEXES = [[numpy.array([_neighbour_index(sq, direction, step) for sq in xrange(SQUARES)])
+                 for step in xrange(Board.SIZE - 1)]
+                for direction in xrange(len(DIRECTIONS))]
+
+
+def encode_positions(positions):
+    """
+    [Position, ...] -> (N, SQUARES) int8 array
+    """
+    masks = numpy.array([(position.white, position.black, position.kings) for position in positions],
+                        dtype=numpy.uint32).reshape(-1, 3)
+    white, black, kings = [(masks[:, [i]] >> _BITS) & 1 for i in xrange(3)]
+    encoded = (white.astype(numpy.int8) - black.astype(numpy.int8)) * (1 + kings.astype(numpy.int8))
+    return encoded
+
+
+def encode_boards(boards):
+    """
+    [Board, ...] -> (N, SQUARES) int8 array
+    """
+    return encode_positions([Position.from_board(board) for board in boards])
+
+
+def get_batch_features(encoded):
+    """
+    (N, SQUARES) encoded positions -> (N, FEATURES_NUMBER) int64 features in checkers.ai.get_features order
+    """
+    white_men = encoded == WHITE_MAN
+    white_kings = encoded == WHITE_KING
+    black_men = encoded == BLACK_MAN
+    black_kings = encoded == BLACK_KING
+    white = white_men | white_kings
+    black = black_men | black_kings
+
+    men = white_men.sum(axis=1) - black_men.sum(axis=1)
+    kings = white_kings.sum(axis=1) - black_kings.sum(axis=1)
+    advance = (white_men * _LINES).sum(axis=1) - (black_men * (Board.SIZE - 1 - _LINES)).sum(axis=1)
+    center = (white & _CENTER).sum(axis=1) - (black & _CENTER).sum(axis=1)
+
+    padded = numpy.hstack([encoded, numpy.full((len(encoded), 1), _OFF_BOARD, dtype=numpy.int8)])
+    empty = padded == EMPTY
+    mobility = numpy.zeros(len(encoded), dtype=numpy.int64)
+    for direction in FORWARD[Checker.WHITE]:
+        mobility += (white_men & empty[:, _RAY_INDEXES[direction][0]]).sum(axis=1)
+    for direction in FORWARD[Checker.BLACK]:
+        mobility -= (black_men & empty[:, _RAY_INDEXES[direction][0]]).sum(axis=1)
+    for direction in xrange(len(DIRECTIONS)):
+        free = numpy.ones(encoded.shape, dtype=bool)
+        for ray_indexes in _RAY_INDEXES[direction]:
+            free &= empty[:, ray_indexes]
+            mobility += (free & white_kings).sum(axis=1) - (free & black_kings).sum(axis=1)
+
+    return numpy.column_stack([men, kings, advance, center, mobility]).astype(numpy.int64)
+
+
+def evaluate_batch(encoded, color, weights=None):
+    """
+    (N, SQUARES) encoded positions -> (N,) int64 scores for color
+    weights: checkers.ai.get_weights() by default
+    """
+    if weights is None:
+        weights = get_weights()
+    scores = get_batch_features(encoded).dot(numpy.array(weights, dtype=numpy.int64))
+    return scores if color == Checker.WHITE else -scores
+
+
+def evaluate_boards(boards, color, weights=None):
+    return evaluate_batch(encode_boards(boards), color, weights)
+
+
+def evaluate_moves(board, color, moves, weights=None):
+    """
+    Scores of positions after every MovePath of moves for color, leaf batch of a search node.
+    """
+    positions = []
+    for move in moves:
+        undo_tokens = apply_move_path(board, move)
+        positions.append(Position.from_board(board))
+        undo_move_path(board, undo_tokens)
+    return evaluate_batch(encode_positions(positions), color, weights)
+
+
+def _collect_positions(position, color, depth, positions):
+    positions.append(position)
+    if depth > 0:
+        next_color = Checker.BLACK if color == Checker.WHITE else Checker.WHITE
+        for _, next_position in position.get_move_paths(color):
+            _collect_positions(next_position, next_color, depth - 1, positions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare batched evaluation with scalar one.')
+    parser.add_argument('board', nargs='?', default='boards/default.json')
+    parser.add_argument('--depth', type=int, default=4, help='evaluate positions reachable in depth turns')
+    args = parser.parse_args()
+
+    positions = []
+    _collect_positions(Position.from_board(load_board_from_file(args.board)), Checker.WHITE, args.depth, positions)
+    boards = [position.to_board() for position in positions]
+
+    start_time = time()
+    scalar_features = [get_features(board) for board in boards]
+    scalar_scores = [evaluate(board, Checker.WHITE) for board in boards]
+    scalar_elapsed = time() - start_time
+
+    start_time = time()
+    encoded = encode_positions(positions)
+    batch_features = get_batch_features(encoded)
+    batch_scores = evaluate_batch(encoded, Checker.WHITE)
+    batch_elapsed = time() - start_time
+
+    equal = (batch_features == numpy.array(scalar_features, dtype=numpy.int64)).all() and \
+        (batch_scores == numpy.array(scalar_scores, dtype=numpy.int64)).all()
+    print '%d positions: scalar %.3fs, batch %.3fs, %s' % (len(positions), scalar_elapsed, batch_elapsed,
+                                                          'equal' if equal else 'DIFFERENT')
+
+
+if __name__ == '__main__':
+    main()
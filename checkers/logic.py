@@ -3,8 +3,9 @@
 from collections import defaultdict
 from copy import deepcopy
 
-from checkers.models import Checker, Board
+from checkers.models import Checker, Board, field_verbose
 from checkers.serialization import load_board_from_file
+from checkers.transposition import TranspositionTable
 
 
 class GameError(Exception):
@@ -14,16 +15,31 @@ class GameError(Exception):
 
 
 class Game(object):
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, board=None, color=Checker.WHITE):
+        """
+        board: start position instead of file, it is changed by game
+        color: player to move first
+        """
         if filename:
             self.board = load_board_from_file(filename)
         else:
-            self.board = Board()
+            self.board = board or Board()
 
         self.white_player = Player(self, Checker.WHITE)
         self.black_player = Player(self, Checker.BLACK)
 
-        self.current_player = self.white_player
+        self.current_player = self.white_player if color == Checker.WHITE else self.black_player
+        self.kicking_checker = None     # checker which must go on kicking in the current turn
+
+        self.start_board = deepcopy(self.board)
+        self.start_color = color
+        self.history = []   # [[(x, y), ...], ...] fields of moved checker in every turn
+
+        self._available_moves = None        # see get_available_moves
+        self._available_moves_key = None    # position and kicking checker of _available_moves
+
+        # shared by ai searches during the game
+        self.transposition_table = TranspositionTable()
 
     def turn(self):
         self.current_player.turn()
@@ -34,28 +50,83 @@ class Game(object):
         if checker.color != player.color:
             raise GameError("You can't move this checker.")
 
+        if self.kicking_checker is not None and checker is not self.kicking_checker:
+            raise GameError("You must go on kicking with %s." % self.kicking_checker)
+
         move = get_move(self.board, checker, x, y)
         if move.type == Move.TYPE.WRONG:
             raise GameError("You can't move checker to this field.")
 
-        if (x, y) not in get_available_fields_for_checker(self.board, checker):
+        if (x, y) not in self.get_available_moves().get((checker.x, checker.y), ()):
             raise GameError("You must kick.")
 
+        if self.kicking_checker is None:
+            self.history.append([(checker.x, checker.y)])
+        self.history[-1].append((x, y))
+
         if move.type == Move.TYPE.MOVE:
             self.board.move_checker(checker, x, y)
-            became_king = self._check_become_king(checker)
-            if not became_king or not self._can_kick_again(checker):
-                self._change_current_player()
+            self._check_become_king(checker)
+            self._change_current_player()
 
         if move.type == Move.TYPE.KICK:
             self.board.move_checker(checker, x, y)
             self.board.remove_checker(move.victim)
             self._check_become_king(checker)
-            if not self._can_kick_again(checker):
+            if self._can_kick_again(checker):
+                self.kicking_checker = checker
+            else:
+                self.kicking_checker = None
                 self._change_current_player()
 
         return move
 
+    def get_available_moves(self):
+        """
+        return {(x, y): {(x2, y2): move type, ...}, ...} hops allowed in the current turn by fields of checkers
+        Moves are found once and kept until the board or the kicking checker is changed.
+        """
+        key = self.board.get_hash(self.current_player.color), self.kicking_checker
+        if key != self._available_moves_key:
+            if self.kicking_checker is not None:
+                fields = _get_available_moves(self.board, self.kicking_checker)[Move.TYPE.KICK]
+                available_moves, move_type = [(self.kicking_checker, fields)], Move.TYPE.KICK
+            else:
+                available_moves, move_type = get_available_moves_and_type(self.board, self.current_player.color)
+
+            self._available_moves = dict(((checker.x, checker.y), dict.fromkeys(fields, move_type))
+                                         for checker, fields in available_moves if fields)
+            self._available_moves_key = key
+        return self._available_moves
+
+    def get_available_fields(self, x, y):
+        """
+        return [(x2, y2), ...] fields where checker in (x, y) can go now
+        """
+        return sorted(self.get_available_moves().get((x, y), ()))
+
+    def get_winner(self):
+        """
+        return color of the winner or None if game goes on, player who can't move loses
+        Cached moves of the turn are used if they are found already, otherwise has_available_moves is enough.
+        """
+        key = self.board.get_hash(self.current_player.color), self.kicking_checker
+        if self.kicking_checker is None and key != self._available_moves_key:
+            return get_winner(self.board, self.current_player.color)
+
+        winner = self.board.get_winner()
+        if winner is None and not self.get_available_moves():
+            winner = Checker.BLACK if self.current_player.color == Checker.WHITE else Checker.WHITE
+        return winner
+
+    def get_move_paths(self):
+        """
+        return [MovePath, ...] which finish the current turn
+        """
+        if self.kicking_checker is not None:
+            return get_available_move_paths(self.board, self.current_player.color, self.kicking_checker)
+        return get_available_move_paths(self.board, self.current_player.color)
+
     def _check_become_king(self, checker):
         if not checker.is_king and is_king_line(self.board, checker.color, checker.y):
             checker.make_king()
@@ -66,10 +137,7 @@ class Game(object):
         self.current_player = self.white_player if self.current_player == self.black_player else self.black_player
 
     def _can_kick_again(self, checker):
-        available_move_fields = get_available_fields_for_checker(self.board, checker)
-        can_kick_again = any(get_move(self.board, checker, new_x, new_y).type == Move.TYPE.KICK
-                             for new_x, new_y in available_move_fields)
-        return can_kick_again
+        return can_kick_again(self.board, checker)
 
 
 class Player(object):
@@ -96,6 +164,7 @@ class Move(object):
         TYPE.MOVE: 'Move',
         TYPE.KICK: 'Kick'
     }
+    __slots__ = ('type', 'victim')
 
     def __init__(self, move_type, victim=None):
         self.type = move_type
@@ -108,6 +177,60 @@ class Move(object):
         return result
 
 
+class MovePath(object):
+    """
+    Whole turn of one checker: a move or a chain of kicks.
+    path: ((x, y), ...) fields of checker from start to end
+    captured: ((x, y), ...) fields of kicked checkers
+    becomes_king: checker is king at the end of turn and wasn't at the start
+    """
+    __slots__ = ('path', 'captured', 'becomes_king')
+
+    def __init__(self, path, captured=(), becomes_king=False):
+        self.path = tuple(path)
+        self.captured = tuple(captured)
+        self.becomes_king = becomes_king
+
+    @property
+    def is_kick(self):
+        return bool(self.captured)
+
+    @property
+    def hops(self):
+        """
+        return [(x1, y1, x2, y2), ...]
+        """
+        return [self.path[i] + self.path[i + 1] for i in xrange(len(self.path) - 1)]
+
+    def __eq__(self, other):
+        return isinstance(other, MovePath) and self.path == other.path
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __str__(self):
+        separator = ':' if self.captured else '-'
+        return separator.join(field_verbose(x, y) for x, y in self.path)
+
+    def __repr__(self):
+        return 'MovePath(%r, %r, %r)' % (self.path, self.captured, self.becomes_king)
+
+
+def apply_move_path(board, move_path):
+    """
+    Make all hops of move_path on board, return undo tokens for undo_move_path.
+    """
+    return [board.apply(move_coords) for move_coords in move_path.hops]
+
+
+def undo_move_path(board, undo_tokens):
+    for undo_token in reversed(undo_tokens):
+        board.undo(undo_token)
+
+
 def get_move(board, checker, x, y):
     if not board.is_valid_field(x, y):
         return Move(Move.TYPE.WRONG)
@@ -159,13 +282,72 @@ def get_move(board, checker, x, y):
         return Move(Move.TYPE.WRONG)
 
 
+def _create_direction_tables():
+    """
+    return (steps, rays) for every valid field:
+    steps[x, y] -> ((dy, neighbour_field, jump_field or None), ...) for directions with neighbour field
+    rays[x, y] -> (fields in direction up to board edge, ...) for all directions
+    """
+    steps = {}
+    rays = {}
+    for x in xrange(Board.SIZE):
+        for y in xrange(Board.SIZE):
+            if not Board.is_valid_field(x, y):
+                continue
+
+            field_steps = []
+            field_rays = []
+            for dx, dy in DIRECTIONS:
+                ray = []
+                ray_x, ray_y = x + dx, y + dy
+                while Board.is_valid_field(ray_x, ray_y):
+                    ray.append((ray_x, ray_y))
+                    ray_x, ray_y = ray_x + dx, ray_y + dy
+
+                field_rays.append(tuple(ray))
+                if ray:
+                    field_steps.append((dy, ray[0], ray[1] if len(ray) > 1 else None))
+
+            steps[x, y] = tuple(field_steps)
+            rays[x, y] = tuple(field_rays)
+    return steps, rays
+
+
+DIRECTIONS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+_STEPS, _RAYS = _create_direction_tables()
+
+
 def _get_available_moves(board, checker):
+    """
+    The same moves as get_move allows, found by walking diagonals from checker.
+    """
     available_moves = defaultdict(list)
-    for x in xrange(board.SIZE):
-        for y in xrange(board.SIZE):
-            move = get_move(board, checker, x, y)
-            if move.type:
-                available_moves[move.type].append((x, y))
+    get_checker = board.get_checker_in_position
+
+    if checker.is_king:
+        for ray in _RAYS[checker.x, checker.y]:
+            victim = None
+            for field in ray:
+                other = get_checker(*field)
+                if other is None:
+                    available_moves[Move.TYPE.KICK if victim else Move.TYPE.MOVE].append(field)
+                elif victim is None and other.color != checker.color:
+                    victim = other
+                else:
+                    break
+    else:
+        forward = 1 if checker.color == Checker.WHITE else -1
+        for dy, neighbour, jump in _STEPS[checker.x, checker.y]:
+            other = get_checker(*neighbour)
+            if other is None:
+                if dy == forward:
+                    available_moves[Move.TYPE.MOVE].append(neighbour)
+            elif jump and other.color != checker.color and get_checker(*jump) is None:
+                available_moves[Move.TYPE.KICK].append(jump)
+
+    # fields are ordered as in board scan by x and y
+    for fields in available_moves.itervalues():
+        fields.sort()
     return available_moves
 
 
@@ -175,11 +357,12 @@ def _get_available_move_fields(board, checker):
     kick_moves = available_moves[Move.TYPE.KICK]
     if kick_moves:
         kick_moves_2 = []
+        x, y = checker.x, checker.y
         for move_field in kick_moves:
-            board_copy = deepcopy(board)
-            checker_copy = board_copy.get_checker_in_position(checker.x, checker.y)
-            board_copy.move_checker(checker_copy, *move_field)
-            available_moves_2 = _get_available_moves(board_copy, checker_copy)
+            # look one hop ahead in place, victim stays on board
+            board.move_checker(checker, *move_field)
+            available_moves_2 = _get_available_moves(board, checker)
+            board.move_checker(checker, x, y)
             if available_moves_2[Move.TYPE.KICK]:
                 kick_moves_2.append(move_field)
 
@@ -189,12 +372,22 @@ def _get_available_move_fields(board, checker):
 
 
 def get_available_moves_all_checkers(board, color):
+    return get_available_moves_and_type(board, color)[0]
+
+
+def get_available_moves_and_type(board, color):
+    """
+    return ([(checker, available_fields), ...], move_type)
+    move_type is Move.TYPE.KICK when player must kick
+    """
     move_fields = {}
     for checker in board.get_checkers(color):
         available_fields, move_type = _get_available_move_fields(board, checker)
         move_fields.setdefault(move_type, []).append((checker, available_fields))
 
-    return move_fields.get(Move.TYPE.KICK) or move_fields.get(Move.TYPE.MOVE, [])
+    if move_fields.get(Move.TYPE.KICK):
+        return move_fields[Move.TYPE.KICK], Move.TYPE.KICK
+    return move_fields.get(Move.TYPE.MOVE, []), Move.TYPE.MOVE
 
 
 def get_available_fields_for_checker(board, checker):
@@ -205,8 +398,81 @@ def get_available_fields_for_checker(board, checker):
     return []
 
 
-def is_king_line(board, color, y):
-    if color == Checker.WHITE:
-        return y == board.SIZE - 1
+def get_available_move_paths(board, color, checker=None):
+    """
+    return [MovePath, ...] of all turns for color, kicks are followed to the end of chain
+    checker: only turns of this checker, which must go on kicking
+    """
+    if checker is not None:
+        available_moves = [(checker, _get_available_moves(board, checker)[Move.TYPE.KICK])]
+        move_type = Move.TYPE.KICK
+    else:
+        available_moves, move_type = get_available_moves_and_type(board, color)
+
+    move_paths = []
+    for checker, available_fields in available_moves:
+        start = (checker.x, checker.y)
+        for field in available_fields:
+            if move_type == Move.TYPE.KICK:
+                _add_kick_paths(board, checker, [start], [], checker.is_king, field, move_paths)
+            else:
+                becomes_king = not checker.is_king and board.is_king_line(checker.color, field[1])
+                move_paths.append(MovePath((start, field), (), becomes_king))
+    return move_paths
+
+
+def _add_kick_paths(board, checker, path, captured, was_king, field, move_paths):
+    """
+    Depth-first search of kick chains, board is changed in place and restored.
+    """
+    undo_token = board.apply((checker.x, checker.y) + field)
+    _, victim, _ = undo_token
+    path.append(field)
+    captured.append((victim.x, victim.y))
+
+    next_fields = _get_available_moves(board, checker)[Move.TYPE.KICK]
+    if next_fields:
+        for next_field in next_fields:
+            _add_kick_paths(board, checker, path, captured, was_king, next_field, move_paths)
     else:
-        return y == 0
+        move_paths.append(MovePath(path, captured, checker.is_king and not was_king))
+
+    captured.pop()
+    path.pop()
+    board.undo(undo_token)
+
+
+def has_available_moves(board, color):
+    """
+    Check if color can make any turn, stops at the first found move without generating all of them.
+    """
+    get_checker = board.get_checker_in_position
+    for checker in board.get_checkers(color):
+        forward = 1 if checker.color == Checker.WHITE else -1
+        for dy, neighbour, jump in _STEPS[checker.x, checker.y]:
+            other = get_checker(*neighbour)
+            if other is None:
+                # a king kicking a far checker could move to the neighbour field as well
+                if checker.is_king or dy == forward:
+                    return True
+            elif jump and other.color != color and get_checker(*jump) is None:
+                return True
+    return False
+
+
+def get_winner(board, color):
+    """
+    return color of the winner or None, color is player to move
+    """
+    winner = board.get_winner()
+    if winner is None and not has_available_moves(board, color):
+        winner = Checker.BLACK if color == Checker.WHITE else Checker.WHITE
+    return winner
+
+
+def can_kick_again(board, checker):
+    return bool(_get_available_moves(board, checker)[Move.TYPE.KICK])
+
+
+def is_king_line(board, color, y):
+    return board.is_king_line(color, y)
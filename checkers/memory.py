@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Memory benchmark of search: __init__ calls of model and search classes per node and shallow sizes of their
+instances, with __slots__ and as they were before __slots__, with attributes in __dict__.
+
+Python 2 has no tracemalloc, so this is an estimate, not an allocation count: __init__ calls are counted by profile
+hook and multiplied by sys.getsizeof of a sample instance, objects referred by attributes are not included. The
+size before __slots__ is measured on an instance of a plain class with the same attributes in __dict__.
+
+Usage: python -m checkers.memory boards/default.json --depth 6
+"""
+import argparse
+import sys
+from copy import deepcopy
+
+from checkers.ai import Search, SearchResult, SearchStats, log_search_stats
+from checkers.logic import Move, MovePath
+from checkers.models import Board, Checker
+from checkers.perft import get_peak_memory
+from checkers.serialization import load_board_from_file
+
+CLASSES = (Board, Checker, Move, MovePath, SearchResult, SearchStats)
+
+
+def get_instance_size(instance):
+    """
+    return size of instance in bytes, without sizes of objects it refers to
+    """
+    size = sys.getsizeof(instance)
+    if hasattr(instance, '__dict__'):
+        size += sys.getsizeof(instance.__dict__)
+    return size
+
+
+class _PlainInstance(object):
+    pass
+
+
+def get_dict_instance_size(instance):
+    """
+    return size of instance if its class had no __slots__, attributes are kept in __dict__ then
+    """
+    plain_instance = _PlainInstance()
+    for cls in type(instance).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            setattr(plain_instance, name, getattr(instance, name, None))
+    return get_instance_size(plain_instance)
+
+
+def count_init_calls(function, classes=CLASSES):
+    """
+    Call function, return (its result, {class: number of __init__ calls})
+    """
+    init_codes = dict((cls.__init__.im_func.func_code, cls) for cls in classes)
+    counts = dict.fromkeys(classes, 0)
+
+    def profile(frame, event, arg):
+        if event == 'call' and frame.f_code in init_codes:
+            counts[init_codes[frame.f_code]] += 1
+
+    sys.setprofile(profile)
+    try:
+        result = function()
+    finally:
+        sys.setprofile(None)
+    return result, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Count and measure objects created by search.')
+    parser.add_argument('board', nargs='?', default='boards/default.json')
+    parser.add_argument('--color', default=Checker.WHITE, choices=[Checker.WHITE, Checker.BLACK])
+    parser.add_argument('--depth', type=int, default=6)
+    args = parser.parse_args()
+
+    board = load_board_from_file(args.board)
+    search = Search(deepcopy(board), trace_callback=log_search_stats)
+    result, counts = count_init_calls(lambda: search.iterative_deepening(args.color, args.depth, random_choice=False))
+
+    checker = board.checkers[0] if board.checkers else Checker(args.color, 0, 0)
+    samples = {
+        Board: board,
+        Checker: checker,
+        Move: Move(Move.TYPE.MOVE),
+        MovePath: result.move or MovePath(((0, 0), (1, 1))),
+        SearchResult: result,
+        SearchStats: result.stats,
+    }
+
+    nodes = max(1, search.nodes)
+    total_size = total_dict_size = 0
+    print '%-12s %12s %21s %21s' % ('', 'init calls', 'with slots', 'before slots')
+    for cls in CLASSES:
+        if samples[cls] is None:
+            continue    # no iteration was completed
+        size = get_instance_size(samples[cls])
+        dict_size = get_dict_instance_size(samples[cls])
+        total_size += size * counts[cls]
+        total_dict_size += dict_size * counts[cls]
+        print '%-12s %12d %4d each %6.1f/node %4d each %6.1f/node' % (
+            cls.__name__, counts[cls], size, float(size * counts[cls]) / nodes,
+            dict_size, float(dict_size * counts[cls]) / nodes)
+
+    print '%d nodes, %.1f bytes per node with slots, %.1f bytes per node before slots, peak memory %.1f MB' % (
+        search.nodes, float(total_size) / nodes, float(total_dict_size) / nodes, get_peak_memory())
+
+if __name__ == '__main__':
+    main()
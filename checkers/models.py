@@ -2,6 +2,7 @@
 """
 https://ru.wikipedia.org/wiki/%D0%A0%D1%83%D1%81%D1%81%D0%BA%D0%B8%D0%B5_%D1%88%D0%B0%D1%88%D0%BA%D0%B8
 """
+from random import Random
 
 
 class BoardError(Exception):
@@ -16,13 +17,30 @@ def field_verbose(x, y):
 
 class Board(object):
     SIZE = 8
+    __slots__ = ('_fields', '_hash', '_numbers', '_advance', '_masks')
 
     def __init__(self):
-        self.checkers = []
+        self._fields = [[None] * self.SIZE for _ in xrange(self.SIZE)]     # self._fields[x][y] -> checker or None
+        self._hash = 0      # zobrist hash of checkers, updated on every change
+        # checkers numbers and lines passed by men, updated on every change as hash
+        self._numbers = {
+            (Checker.WHITE, False): 0, (Checker.WHITE, True): 0,
+            (Checker.BLACK, False): 0, (Checker.BLACK, True): 0,
+        }
+        self._advance = {Checker.WHITE: 0, Checker.BLACK: 0}
+        # bit masks of checkers of every color and of kings as in checkers.bitboard, updated on every change as hash
+        self._masks = {Checker.WHITE: 0, Checker.BLACK: 0, KINGS: 0}
+
+    @property
+    def checkers(self):
+        return [checker for column in self._fields for checker in column if checker]
 
     def add_checker(self, checker):
         self._check_free_field(checker.x, checker.y)
-        self.checkers.append(checker)
+        if checker.board is not None:
+            raise BoardError("This checker is already on board: %s." % checker)
+
+        self._put_checker(checker)
 
     def move(self, x1, y1, x2, y2):
         checker = self.get_checker_in_position(x1, y1)
@@ -30,7 +48,7 @@ class Board(object):
 
     def move_checker(self, checker, x, y):
         self._check_free_field(x, y)
-        if checker not in self.checkers:
+        if not self.has_checker(checker):
             raise BoardError("This checker not on board, can't move it: %s." % checker)
 
         checker.move(x, y)
@@ -39,36 +57,179 @@ class Board(object):
         if not self.is_valid_field(x, y):
             raise BoardError("Invalid checker position: (%d, %d)." % (x, y))
 
-        if self.get_checker_in_position(x, y):
+        if self._fields[x][y]:
             raise BoardError("Checker in %s already exists." % field_verbose(x, y))
 
+    def _put_checker(self, checker):
+        checker.board = self
+        self._fields[checker.x][checker.y] = checker
+        self._hash ^= _zobrist_key(checker.color, checker.is_king, checker.x, checker.y)
+        self._numbers[checker.color, checker.is_king] += 1
+        bit = FIELD_BITS[checker.x][checker.y]
+        self._masks[checker.color] |= bit
+        if checker.is_king:
+            self._masks[KINGS] |= bit
+        else:
+            self._advance[checker.color] += self.get_advance(checker.color, checker.y)
+
+    def _take_checker(self, checker):
+        checker.board = None
+        self._fields[checker.x][checker.y] = None
+        self._hash ^= _zobrist_key(checker.color, checker.is_king, checker.x, checker.y)
+        self._numbers[checker.color, checker.is_king] -= 1
+        bit = FIELD_BITS[checker.x][checker.y]
+        self._masks[checker.color] &= ~bit
+        if checker.is_king:
+            self._masks[KINGS] &= ~bit
+        else:
+            self._advance[checker.color] -= self.get_advance(checker.color, checker.y)
+
+    def _update_checker_position(self, checker, x, y):
+        """
+        Called by Checker.move to keep fields index, hash and counters in sync.
+        """
+        self._fields[checker.x][checker.y] = None
+        self._fields[x][y] = checker
+        self._hash ^= (_zobrist_key(checker.color, checker.is_king, checker.x, checker.y) ^
+                       _zobrist_key(checker.color, checker.is_king, x, y))
+        bits = FIELD_BITS[checker.x][checker.y] | FIELD_BITS[x][y]
+        self._masks[checker.color] ^= bits
+        if checker.is_king:
+            self._masks[KINGS] ^= bits
+        else:
+            self._advance[checker.color] += (self.get_advance(checker.color, y) -
+                                             self.get_advance(checker.color, checker.y))
+
+    def _update_checker_king(self, checker, is_king):
+        """
+        Called by Checker.make_king to keep hash and counters in sync.
+        """
+        self._hash ^= (_zobrist_key(checker.color, checker.is_king, checker.x, checker.y) ^
+                       _zobrist_key(checker.color, is_king, checker.x, checker.y))
+        self._numbers[checker.color, checker.is_king] -= 1
+        self._numbers[checker.color, is_king] += 1
+        self._masks[KINGS] ^= FIELD_BITS[checker.x][checker.y]
+        advance = self.get_advance(checker.color, checker.y)
+        self._advance[checker.color] += -advance if is_king else advance
+
     def remove_checker(self, checker):
-        if checker not in self.checkers:
+        if not self.has_checker(checker):
             raise BoardError("This checker not on board, can't remove it: %s." % checker)
-        self.checkers.remove(checker)
 
-    def get_checker_in_position(self, x, y):
-        for checker in self.checkers:
-            if checker.x == x and checker.y == y:
+        self._take_checker(checker)
+
+    def apply(self, move_coords):
+        """
+        Make move (x1, y1, x2, y2) without validation: kicked checker is removed, checker on the king line
+        becomes king. Return undo token for Board.undo.
+        """
+        x1, y1, x2, y2 = move_coords
+        checker = self._fields[x1][y1]
+
+        victim = self._get_checker_between(x1, y1, x2, y2)
+        if victim:
+            self._take_checker(victim)
+
+        checker.move(x2, y2)
+
+        became_king = not checker.is_king and self.is_king_line(checker.color, y2)
+        if became_king:
+            checker.make_king()
+
+        return move_coords, victim, became_king
+
+    def undo(self, undo_token):
+        """
+        Take back move made by Board.apply, moves must be undone in reverse order.
+        """
+        (x1, y1, x2, y2), victim, became_king = undo_token
+        checker = self._fields[x2][y2]
+
+        if became_king:
+            checker.make_king(False)
+
+        checker.move(x1, y1)
+
+        if victim:
+            self._put_checker(victim)
+
+    def _get_checker_between(self, x1, y1, x2, y2):
+        x_direction = 1 if x2 > x1 else -1
+        y_direction = 1 if y2 > y1 else -1
+        for i in xrange(1, abs(x2 - x1)):
+            checker = self._fields[x1 + i * x_direction][y1 + i * y_direction]
+            if checker:
                 return checker
         return None
 
-    def get_winner(self):
-        checker_numbers = dict.fromkeys([Checker.WHITE, Checker.BLACK], 0)
-        for checker in self.checkers:
-            checker_numbers[checker.color] += 1
+    def has_checker(self, checker):
+        return checker is not None and checker.board is self and self._fields[checker.x][checker.y] is checker
+
+    def get_hash(self, color):
+        """
+        Zobrist hash of position with color to move.
+        """
+        return self._hash ^ ZOBRIST_BLACK_TO_MOVE_KEY if color == Checker.BLACK else self._hash
+
+    def __getstate__(self):
+        return _get_slots_state(self)
+
+    def __setstate__(self, state):
+        _set_slots_state(self, state)
+
+    def get_masks(self):
+        """
+        return (white, black, kings) bit masks of checkers, field (x, y) is bit y * SIZE / 2 + x / 2,
+        see checkers.bitboard.Position
+        """
+        masks = self._masks
+        return masks[Checker.WHITE], masks[Checker.BLACK], masks[KINGS]
+
+    def get_checker_in_position(self, x, y):
+        if 0 <= x < self.SIZE and 0 <= y < self.SIZE:
+            return self._fields[x][y]
+        return None
 
-        if checker_numbers[Checker.WHITE] == 0:
+    def get_winner(self):
+        """
+        return color of the only player with checkers or None, see also checkers.logic.get_winner
+        """
+        if not self.get_checkers_number(Checker.WHITE):
             return Checker.BLACK
 
-        if checker_numbers[Checker.BLACK] == 0:
+        if not self.get_checkers_number(Checker.BLACK):
             return Checker.WHITE
 
         return None
 
+    def get_checkers_number(self, color=None, is_king=None):
+        """
+        Number of checkers of color or of both colors, only kings or only men if is_king is given.
+        """
+        colors = (color,) if color else (Checker.WHITE, Checker.BLACK)
+        kinds = (is_king,) if is_king is not None else (False, True)
+        return sum(self._numbers[checker_color, kind] for checker_color in colors for kind in kinds)
+
+    def get_men_advance(self, color):
+        """
+        Sum of lines passed by men of color.
+        """
+        return self._advance[color]
+
+    @classmethod
+    def get_advance(cls, color, y):
+        return y if color == Checker.WHITE else cls.SIZE - 1 - y
+
     def get_checkers(self, color):
         return (checker for checker in self.checkers if checker.color == color)
 
+    @classmethod
+    def is_king_line(cls, color, y):
+        if color == Checker.WHITE:
+            return y == cls.SIZE - 1
+        else:
+            return y == 0
+
     @staticmethod
     def is_black_field(x, y):
         return (x + y + 1) % 2
@@ -81,6 +242,7 @@ class Board(object):
 class Checker(object):
     BLACK = 'black'
     WHITE = 'white'
+    __slots__ = ('x', 'y', 'color', 'is_king', 'board')
 
     def __init__(self, color, x, y):
         assert color == self.BLACK or color == self.WHITE
@@ -89,13 +251,56 @@ class Checker(object):
         self.y = y
         self.color = color
         self.is_king = False
+        self.board = None   # set by Board.add_checker
 
     def move(self, x, y):
+        if self.board is not None:
+            self.board._update_checker_position(self, x, y)
         self.x = x
         self.y = y
 
-    def make_king(self):
-        self.is_king = True
+    def make_king(self, is_king=True):
+        if self.board is not None and self.is_king != is_king:
+            self.board._update_checker_king(self, is_king)
+        self.is_king = is_king
+
+    def __getstate__(self):
+        return _get_slots_state(self)
+
+    def __setstate__(self, state):
+        _set_slots_state(self, state)
 
     def __str__(self):
         return "%s checker in %s".capitalize() % (self.color, field_verbose(self.x, self.y))
+
+
+def _get_slots_state(instance):
+    # classes with __slots__ have no __dict__, pickle protocols 0 and 1 need the state to be given explicitly
+    return dict((name, getattr(instance, name)) for name in instance.__slots__)
+
+
+def _set_slots_state(instance, state):
+    for name, value in state.iteritems():
+        setattr(instance, name, value)
+
+
+KINGS = 'kings'     # key of kings mask in Board._masks
+# FIELD_BITS[x][y] -> bit of field in masks of Board.get_masks, 0 for white fields
+FIELD_BITS = [[1 << (y * (Board.SIZE // 2) + x // 2) if Board.is_valid_field(x, y) else 0 for y in xrange(Board.SIZE)]
+              for x in xrange(Board.SIZE)]
+
+
+def _create_zobrist_keys(seed=0):
+    random = Random(seed)
+    return dict(
+        ((color, is_king), [[random.getrandbits(64) for _ in xrange(Board.SIZE)] for _ in xrange(Board.SIZE)])
+        for color in (Checker.WHITE, Checker.BLACK)
+        for is_king in (False, True)
+    ), random.getrandbits(64)
+
+
+ZOBRIST_KEYS, ZOBRIST_BLACK_TO_MOVE_KEY = _create_zobrist_keys()
+
+
+def _zobrist_key(color, is_king, x, y):
+    return ZOBRIST_KEYS[color, is_king][x][y]
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Root-parallel search: root moves are split between worker processes.
+
+Workers get positions as bitboard Position, not as Board with Checker objects. The best score found so far is
+shared between workers and used as alpha bound for moves started later.
+
+ParallelSearch.iterative_deepening is the parallel mode of checkers.ai search, see parallel_search argument of
+checkers.ai.search_ai_move. The pool is kept between moves, so one ParallelSearch is used for the whole game.
+
+Usage: python -m checkers.parallel boards/default.json --depth 4 --processes 4
+"""
+import argparse
+import sys
+from multiprocessing import Pool, Value, cpu_count
+from random import choice
+from time import time
+
+from checkers.ai import Search, SearchResult, SearchTimeout, DEFAULT_DEPTH, INFINITY, MAX_PLY, WIN_SCORE, get_moves
+from checkers.bitboard import Position
+from checkers.logic import MovePath
+from checkers.models import Checker
+from checkers.serialization import load_board_from_file
+from checkers.tablebase import Tablebase
+from checkers.transposition import TranspositionTable
+
+_shared_alpha = None    # best root score found so far, set in every worker by _init_worker
+_shared_stop = None     # set by ParallelSearch.stop
+_worker_table = None    # transposition table kept by worker between tasks
+_worker_tablebase = None
+
+
+def _init_worker(shared_alpha, shared_stop, tablebase_directory):
+    global _shared_alpha, _shared_stop, _worker_table, _worker_tablebase
+    _shared_alpha = shared_alpha
+    _shared_stop = shared_stop
+    _worker_table = TranspositionTable()
+    _worker_tablebase = Tablebase(tablebase_directory) if tablebase_directory else None
+
+
+class _WorkerSearch(Search):
+    """
+    Search of root moves in worker, interrupted at deadline or by ParallelSearch.stop.
+    """
+
+    def __init__(self, board, deadline):
+        super(_WorkerSearch, self).__init__(board, _worker_table, tablebase=_worker_tablebase)
+        self._deadline = deadline
+
+    def _check_budget(self):
+        if _shared_stop.value:
+            raise SearchTimeout()
+        super(_WorkerSearch, self)._check_budget()
+
+
+def _search_root_move(task):
+    """
+    return (index, score or None if search is interrupted, score is exact, nodes)
+    """
+    index, position, color, path, depth, all_best, deadline = task
+
+    best_score = _shared_alpha.value
+    # when collecting equal moves the window must include best score to get exact scores for them
+    alpha = best_score - 1 if all_best and best_score > -INFINITY else best_score
+
+    search = _WorkerSearch(position.to_board(), deadline)
+    _worker_table.new_search()
+    try:
+        score = search.search_move(color, MovePath(path), depth, alpha)
+    except SearchTimeout:
+        return index, None, False, search.nodes
+
+    with _shared_alpha.get_lock():
+        if score > _shared_alpha.value:
+            _shared_alpha.value = score
+
+    return index, score, score > alpha, search.nodes
+
+
+class ParallelSearch(object):
+    """
+    Keeps worker pool between searches, call close when it is not needed anymore.
+    """
+
+    def __init__(self, processes=None, tablebase_directory=None):
+        """
+        tablebase_directory: checkers.tablebase directory opened by every worker
+        """
+        self.processes = processes or cpu_count()
+        self._shared_alpha = Value('i', -INFINITY)
+        self._shared_stop = Value('b', 0)
+        self._pool = Pool(self.processes, _init_worker, (self._shared_alpha, self._shared_stop, tablebase_directory))
+
+    def iterative_deepening(self, board, color, max_depth, random_choice=True, time_limit=None, node_limit=None,
+                            progress_callback=None, book=None):
+        """
+        Parallel search with depth 1, 2, ... max_depth while budget allows, return SearchResult of the deepest
+        completed iteration like checkers.ai.Search.iterative_deepening.
+        node_limit: no new iteration is started after this many nodes
+        """
+        start_time = time()
+        self._shared_stop.value = 0
+        deadline = start_time + time_limit if time_limit is not None else None
+
+        moves = get_moves(board, color)
+        result = SearchResult(elapsed=time() - start_time)
+        if len(moves) == 1:
+            result.move = moves[0]
+            result.best_moves = [(moves[0], 0)]
+            return result
+
+        book_move = book.choose_move(board, color, moves) if book and moves else None
+        if book_move:
+            result.move = book_move
+            result.from_book = True
+            result.elapsed = time() - start_time
+            return result
+
+        nodes = 0
+        for depth in xrange(1, max_depth + 1):
+            iteration_result = self.search(board, color, depth, random_choice, deadline, result.move)
+            if iteration_result is None or iteration_result.move is None:
+                break
+
+            nodes += iteration_result.nodes
+            result = iteration_result
+            result.nodes = nodes
+            result.elapsed = time() - start_time
+            if progress_callback:
+                progress_callback(result)
+
+            if abs(result.score) > WIN_SCORE - MAX_PLY or (node_limit is not None and nodes >= node_limit):
+                break
+
+        if result.move is None and moves:
+            # not even first iteration is completed
+            result.move = moves[0]
+
+        result.elapsed = time() - start_time
+        return result
+
+    def search(self, board, color, depth=DEFAULT_DEPTH, random_choice=True, deadline=None, first_move=None):
+        """
+        return SearchResult, the same as checkers.ai.Search.search_root would find, or None if search is
+        interrupted by deadline or stop
+        first_move: MovePath searched first, e.g. the best move of the previous iteration
+        """
+        start_time = time()
+        position = Position.from_board(board)
+        moves = get_moves(board, color)
+        if not moves:
+            return SearchResult(elapsed=time() - start_time)
+        if first_move is not None:
+            moves.sort(key=lambda move: move != first_move)
+
+        tasks = [(index, position, color, move.path, depth, random_choice, deadline)
+                 for index, move in enumerate(moves)]
+
+        self._shared_alpha.value = -INFINITY
+        # the first move sets alpha bound for the others
+        results = [self._pool.apply(_search_root_move, (tasks[0],))]
+        if results[0][1] is None:
+            return None
+        results.extend(self._pool.imap_unordered(_search_root_move, tasks[1:]))
+        if any(score is None for _, score, _, _ in results):
+            return None
+
+        # merge in moves order, so result doesn't depend on which worker finished first
+        results.sort()
+        exact_scores = [score for _, score, is_exact, _ in results if is_exact]
+        best_score = max(exact_scores)
+        best_moves = [(moves[index], score) for index, score, is_exact, _ in results
+                      if is_exact and score == best_score]
+
+        move = choice(best_moves)[0] if random_choice else best_moves[0][0]
+        nodes = sum(result_nodes for _, _, _, result_nodes in results)
+        return SearchResult(move, best_score, depth, nodes, time() - start_time, best_moves)
+
+    def stop(self):
+        """
+        Interrupt running search, it may be called from another thread.
+        """
+        self._shared_stop.value = 1
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+def compare_with_serial(board, color, depth=DEFAULT_DEPTH, processes=None):
+    """
+    return (serial SearchResult, parallel SearchResult, speedup), both searches start with empty tables
+    """
+    start_time = time()
+    search = Search(board)
+    best_moves = search.search_root(color, depth, all_best=True)
+    serial_elapsed = time() - start_time
+    serial_result = SearchResult(best_moves[0][0] if best_moves else None, best_moves[0][1] if best_moves else 0,
+                                 depth, search.nodes, serial_elapsed, best_moves)
+
+    parallel_search = ParallelSearch(processes)
+    try:
+        parallel_result = parallel_search.search(board, color, depth, random_choice=True)
+    finally:
+        parallel_search.close()
+
+    speedup = serial_result.elapsed / parallel_result.elapsed if parallel_result.elapsed else 0.0
+    return serial_result, parallel_result, speedup
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare parallel root search with serial search.')
+    parser.add_argument('board', nargs='?', default='boards/default.json')
+    parser.add_argument('--color', default=Checker.WHITE, choices=[Checker.WHITE, Checker.BLACK])
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    processes = args.processes or cpu_count()
+    print 'cpus: %d, processes: %d' % (cpu_count(), processes)
+    if processes > cpu_count():
+        sys.stderr.write('warning: more processes than cpus, parallel search is slowed down by switching between '
+                         'them\n')
+
+    board = load_board_from_file(args.board)
+    serial_result, parallel_result, speedup = compare_with_serial(board, args.color, args.depth, args.processes)
+    print 'serial:   %s' % serial_result
+    print 'parallel: %s' % parallel_result
+    print 'speedup:  %.2f' % speedup
+
+
+if __name__ == '__main__':
+    main()
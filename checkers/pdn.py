@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+PDN (Portable Draughts Notation) import and export of games.
+
+Fields are written as in russian checkers: a1 is the left corner of white, moves are "c3-d4" and kicks "c3:e5:c7".
+Start position is given by FEN tag "W:Wc3,Kd4:Bb8" (player to move, white and black checkers, K for kings),
+the default start position is used without it.
+
+Files are read game by game, so memory doesn't depend on file size. Games are independent, so they can be
+checked in a process pool.
+
+Usage:
+    python -m checkers.pdn check games.pdn --processes 4
+    python -m checkers.pdn convert games.pdn games.rec
+"""
+import argparse
+import re
+from collections import namedtuple
+from copy import deepcopy
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+from checkers.logic import Game, GameError
+from checkers.models import Board, BoardError, Checker, field_verbose
+from checkers.records import RecordWriter
+from checkers.serialization import load_board_from_file
+
+DEFAULT_BOARD_FILENAME = 'boards/default.json'
+BATCH_SIZE = 1000   # games read from file and sent to pool at once
+LINE_LENGTH = 80
+
+RESULTS = {
+    '2-0': Checker.WHITE, '1-0': Checker.WHITE,
+    '0-2': Checker.BLACK, '0-1': Checker.BLACK,
+    '1-1': 'draw', '1/2-1/2': 'draw',
+    '*': None,
+}
+RESULT_TAGS = {Checker.WHITE: '2-0', Checker.BLACK: '0-2', 'draw': '1-1', None: '*'}
+
+_TAG_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_MOVE_RE = re.compile(r'^[a-h][1-8](?:[-x:][a-h][1-8])+$')
+_MOVE_NUMBER_RE = re.compile(r'^\d+\.+')
+_ANNOTATION_RE = re.compile(r'[!?]+$')
+
+PDNGame = namedtuple('PDNGame', 'tags moves result')    # moves: ['c3-d4', ...]
+
+
+class PDNError(Exception):
+    """
+    Wrong PDN game
+    """
+
+
+def iter_game_texts(f):
+    """
+    Yield text of every game of file object, game ends with result or with tags of the next game.
+    """
+    lines = []
+    has_moves = False
+    for line in f:
+        stripped = line.strip()
+        if stripped.startswith('[') and has_moves:
+            yield ''.join(lines)
+            lines = []
+            has_moves = False
+
+        lines.append(line)
+        if stripped and not stripped.startswith('['):
+            has_moves = True
+            if stripped.split()[-1] in RESULTS:
+                yield ''.join(lines)
+                lines = []
+                has_moves = False
+
+    if ''.join(lines).strip():
+        yield ''.join(lines)
+
+
+def parse_game(text):
+    """
+    return PDNGame of one game text
+    """
+    tags = dict((name, value.replace('\\"', '"')) for name, value in _TAG_RE.findall(text))
+    movetext = _TAG_RE.sub(' ', text)
+
+    moves = []
+    result = RESULTS.get(tags.get('Result'))
+    for token in _iter_tokens(movetext):
+        if token in RESULTS:
+            result = RESULTS[token]
+            break
+        token = _ANNOTATION_RE.sub('', _MOVE_NUMBER_RE.sub('', token))
+        if not token or token.startswith('$'):
+            continue
+        if not _MOVE_RE.match(token):
+            raise PDNError('Wrong move %r.' % token)
+        moves.append(token)
+    return PDNGame(tags, moves, result)
+
+
+def _iter_tokens(movetext):
+    # comments and variations are skipped
+    comment = False
+    variation_depth = 0
+    for token in re.findall(r'\{|\}|\(|\)|[^\s{}()]+', movetext):
+        if comment:
+            comment = token != '}'
+        elif token == '{':
+            comment = True
+        elif token == '(':
+            variation_depth += 1
+        elif token == ')':
+            variation_depth -= 1
+        elif not variation_depth:
+            yield token
+
+
+def parse_fen(fen):
+    """
+    return (Board, color to move)
+    """
+    parts = fen.strip().strip('"').split(':')
+    colors = {'W': Checker.WHITE, 'B': Checker.BLACK}
+    if not parts or parts[0].upper() not in colors:
+        raise PDNError('Wrong FEN %r.' % fen)
+
+    checkers = []
+    for part in parts[1:]:
+        if not part:
+            continue
+        if part[0].upper() not in colors:
+            raise PDNError('Wrong FEN %r.' % fen)
+        color = colors[part[0].upper()]
+        for field in filter(None, part[1:].split(',')):
+            is_king = field[0] == 'K'
+            x, y = parse_field(field.lstrip('K'))
+            checker = Checker(color, x, y)
+            checker.make_king(is_king)
+            checkers.append(checker)
+
+    board = Board()
+    for checker in checkers:
+        board.add_checker(checker)
+    return board, colors[parts[0].upper()]
+
+
+def parse_field(field):
+    if len(field) != 2 or field[0] not in 'abcdefgh' or field[1] not in '12345678':
+        raise PDNError('Wrong field %r, only algebraic notation is supported.' % field)
+    x, y = 'abcdefgh'.index(field[0]), int(field[1]) - 1
+    if not Board.is_valid_field(x, y):
+        raise PDNError('Wrong field %r.' % field)
+    return x, y
+
+
+def create_fen(board, color):
+    parts = ['W' if color == Checker.WHITE else 'B']
+    for checkers_color, letter in ((Checker.WHITE, 'W'), (Checker.BLACK, 'B')):
+        fields = ['K' * checker.is_king + field_verbose(checker.x, checker.y)
+                  for checker in board.get_checkers(checkers_color)]
+        parts.append(letter + ','.join(fields))
+    return ':'.join(parts)
+
+
+def get_start_position(pdn_game):
+    """
+    return (Board, color to move) from FEN tag or the default start position
+    """
+    if 'FEN' in pdn_game.tags:
+        return parse_fen(pdn_game.tags['FEN'])
+    return load_board_from_file(DEFAULT_BOARD_FILENAME), Checker.WHITE
+
+
+def replay_game(pdn_game):
+    """
+    Play moves of PDNGame through checkers.logic.Game.
+    Yield (board, color, MovePath) before every turn, board is the game board, it is changed after the yield.
+    """
+    board, color = get_start_position(pdn_game)
+    game = Game(board=board, color=color)
+
+    for number, move_text in enumerate(pdn_game.moves):
+        fields = [parse_field(field) for field in re.split('[-x:]', move_text)]
+        move_paths = [move_path for move_path in game.get_move_paths() if _matches(move_path, fields)]
+        if len(move_paths) != 1:
+            raise PDNError('%s move %d %s is %s.' % (game.current_player.color, number // 2 + 1, move_text,
+                                                     'ambiguous' if move_paths else 'not possible'))
+
+        move_path = move_paths[0]
+        yield game.board, game.current_player.color, move_path
+
+        for x1, y1, x2, y2 in move_path.hops:
+            try:
+                game.current_player.move(game.board.get_checker_in_position(x1, y1), x2, y2)
+            except GameError, e:
+                raise PDNError(str(e))
+
+
+def _matches(move_path, fields):
+    # kicks may be written by start and end fields only
+    if len(fields) == len(move_path.path):
+        return tuple(fields) == move_path.path
+    return len(fields) == 2 and move_path.is_kick and (move_path.path[0], move_path.path[-1]) == tuple(fields)
+
+
+def iter_games(f):
+    """
+    Yield PDNGame of every game of file object.
+    """
+    for text in iter_game_texts(f):
+        yield parse_game(text)
+
+
+def format_game(board, color, paths, winner=None, tags=None):
+    """
+    return PDN text of game, moves are checked by playing them on a copy of board
+    paths: [((x, y), ...), ...] fields of moved checker in every turn, e.g. Game.history
+    """
+    tags = dict(tags or {})
+    tags['Result'] = RESULT_TAGS[winner]
+    tags['FEN'] = create_fen(board, color)
+    tags.setdefault('GameType', '25')
+    lines = ['[%s "%s"]' % (name, value.replace('"', '\\"')) for name, value in sorted(tags.items())]
+
+    game = Game(board=deepcopy(board), color=color)
+    tokens = []
+    number = 1
+    for path in paths:
+        path = tuple(tuple(field) for field in path)
+        move_paths = [move_path for move_path in game.get_move_paths() if move_path.path == path]
+        if not move_paths:
+            raise PDNError('Turn %s is not possible.' % '-'.join(field_verbose(x, y) for x, y in path))
+
+        # move number is kept on the same line with the move
+        if game.current_player.color == Checker.WHITE:
+            tokens.append('%d. %s' % (number, move_paths[0]))
+        elif not tokens:
+            tokens.append('%d... %s' % (number, move_paths[0]))
+        else:
+            tokens.append(str(move_paths[0]))
+        if game.current_player.color == Checker.BLACK:
+            number += 1
+
+        for x1, y1, x2, y2 in move_paths[0].hops:
+            game.current_player.move(game.board.get_checker_in_position(x1, y1), x2, y2)
+    tokens.append(tags['Result'])
+
+    movetext_lines = ['']
+    for token in tokens:
+        if movetext_lines[-1] and len(movetext_lines[-1]) + 1 + len(token) > LINE_LENGTH:
+            movetext_lines.append('')
+        movetext_lines[-1] = movetext_lines[-1] + ' ' + token if movetext_lines[-1] else token
+    return '\n'.join(lines + [''] + movetext_lines) + '\n\n'
+
+
+def save_game(f, game, winner=None, tags=None):
+    """
+    Write checkers.logic.Game to file object.
+    """
+    f.write(format_game(game.start_board, game.start_color, game.history, winner, tags))
+
+
+def check_game(text):
+    """
+    Parse and replay one game text.
+    return (PDNGame, [((x, y), ...), ...] paths of turns, error message or None)
+    """
+    try:
+        pdn_game = parse_game(text)
+        paths = [move_path.path for _, _, move_path in replay_game(pdn_game)]
+    except (PDNError, BoardError), e:
+        return None, [], str(e)
+    return pdn_game, paths, None
+
+
+def check_games(f, processes=None):
+    """
+    Yield check_game results of every game of file object in file order.
+    Games are read and checked by batches, so memory doesn't depend on file size.
+    """
+    texts = iter_game_texts(f)
+    if processes == 1:
+        for text in texts:
+            yield check_game(text)
+        return
+
+    processes = processes or cpu_count()
+    pool = Pool(processes)
+    try:
+        while True:
+            batch = list(islice(texts, BATCH_SIZE))
+            if not batch:
+                break
+            for result in pool.imap(check_game, batch, chunksize=max(1, BATCH_SIZE // (4 * processes))):
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check PDN games or convert them to records file.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    check_parser = subparsers.add_parser('check')
+    check_parser.add_argument('pdn')
+    check_parser.add_argument('--processes', type=int, default=None)
+
+    convert_parser = subparsers.add_parser('convert')
+    convert_parser.add_argument('pdn')
+    convert_parser.add_argument('records')
+    convert_parser.add_argument('--processes', type=int, default=None)
+
+    args = parser.parse_args()
+
+    games = errors = turns = 0
+    writer = None
+    records_file = open(args.records, 'ab') if args.command == 'convert' else None
+    try:
+        if records_file:
+            writer = RecordWriter(records_file)
+        with open(args.pdn) as f:
+            for pdn_game, paths, error in check_games(f, args.processes):
+                games += 1
+                if error:
+                    errors += 1
+                    print 'game %d: %s' % (games, error)
+                    continue
+
+                turns += len(paths)
+                if writer:
+                    board, color = get_start_position(pdn_game)
+                    writer.write_game(board, color, paths, pdn_game.result)
+    finally:
+        if records_file:
+            records_file.close()
+
+    print '%d games, %d turns, %d errors' % (games, turns, errors)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Perft: number of positions reachable in depth turns, a benchmark and a check of move generation.
+
+Counts are compared with reference counts in checkers/perft.json, {board filename: {color to move: {depth: count}}}.
+Run with --update after a change of rules to store new counts.
+
+Usage:
+    python -m checkers.perft --depth 5
+    python -m checkers.perft boards/default.json --depth 7 --bitboard
+"""
+import argparse
+import glob
+import json
+import resource
+import sys
+from time import time
+
+from checkers.bitboard import Position
+from checkers.logic import get_available_move_paths, apply_move_path, undo_move_path
+from checkers.models import Checker
+from checkers.serialization import load_board_from_file
+
+DEFAULT_DEPTH = 4
+REFERENCE_FILENAME = 'checkers/perft.json'
+
+
+def perft(board, color, depth):
+    """
+    return number of turn sequences of length depth, kick chains are single turns
+    """
+    if depth <= 0:
+        return 1
+
+    moves = get_available_move_paths(board, color)
+    if depth == 1:
+        return len(moves)
+
+    next_color = Checker.BLACK if color == Checker.WHITE else Checker.WHITE
+    nodes = 0
+    for move in moves:
+        undo_tokens = apply_move_path(board, move)
+        nodes += perft(board, next_color, depth - 1)
+        undo_move_path(board, undo_tokens)
+    return nodes
+
+
+def perft_bitboard(position, color, depth):
+    """
+    Same as perft on checkers.bitboard.Position.
+    """
+    if depth <= 0:
+        return 1
+
+    move_paths = position.get_move_paths(color)
+    if depth == 1:
+        return len(move_paths)
+
+    next_color = Checker.BLACK if color == Checker.WHITE else Checker.WHITE
+    return sum(perft_bitboard(next_position, next_color, depth - 1) for _, next_position in move_paths)
+
+
+def get_peak_memory():
+    """
+    return peak resident memory of the process in megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on Mac OS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def load_references(filename=REFERENCE_FILENAME):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except IOError:
+        return {}
+
+
+def save_references(references, filename=REFERENCE_FILENAME):
+    with open(filename, 'w') as f:
+        json.dump(references, f, indent=4, sort_keys=True, separators=(',', ': '))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Count and time positions reachable in depth turns.')
+    parser.add_argument('boards', nargs='*', help='all boards/*.json by default')
+    parser.add_argument('--color', default=Checker.WHITE, choices=[Checker.WHITE, Checker.BLACK])
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    parser.add_argument('--bitboard', action='store_true', help='use checkers.bitboard instead of checkers.logic')
+    parser.add_argument('--update', action='store_true', help='store counts as reference counts')
+    args = parser.parse_args()
+
+    board_filenames = args.boards or sorted(glob.glob('boards/*.json'))
+    references = load_references()
+    failed = False
+    total_nodes = 0
+    total_time = 0.0
+
+    for board_filename in board_filenames:
+        board = load_board_from_file(board_filename)
+        board_references = references.setdefault(board_filename, {}).setdefault(args.color, {})
+        for depth in xrange(1, args.depth + 1):
+            start_time = time()
+            if args.bitboard:
+                nodes = perft_bitboard(Position.from_board(board), args.color, depth)
+            else:
+                nodes = perft(board, args.color, depth)
+            elapsed = time() - start_time
+            total_nodes += nodes
+            total_time += elapsed
+
+            # json keys are strings
+            reference = board_references.get(str(depth))
+            if args.update:
+                board_references[str(depth)] = nodes
+                status = 'stored'
+            elif reference is None:
+                status = 'no reference'
+            elif reference == nodes:
+                status = 'ok'
+            else:
+                status = 'FAILED, expected %d' % reference
+                failed = True
+
+            print '%s %s depth %d: %d nodes in %.3fs, %.0f nodes/s, %s' % (
+                board_filename, args.color, depth, nodes, elapsed, nodes / elapsed if elapsed else 0.0, status)
+
+    print 'total: %d nodes in %.2fs, %.0f nodes/s, peak memory %.1f MB' % (
+        total_nodes, total_time, total_nodes / total_time if total_time else 0.0, get_peak_memory())
+
+    if args.update:
+        save_references(references)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary records of positions and games, read and written as a stream.
+
+File is MAGIC followed by records, every record is a header (type, payload length) and payload:
+    position: flags (bit 0: black to move), occupied squares mask: uint32,
+              2 bits (black, king) per occupied square in squares order, padded to bytes
+    game: start position, result, turns number: uint16, every turn as path length and path squares
+
+Squares are bitboard squares, see checkers.bitboard. The start position takes 11 bytes, a turn 3 bytes.
+
+Usage:
+    python -m checkers.records pack positions.rec boards/*.json
+    python -m checkers.records dump positions.rec
+"""
+import argparse
+import os
+import struct
+from collections import namedtuple
+
+from checkers.bitboard import Position, iter_squares, square, square_coords
+from checkers.models import Checker, field_verbose
+from checkers.serialization import load_board_from_file, save_board
+
+MAGIC = 'CHKREC01'
+RECORD_HEADER = struct.Struct('<BH')        # type, payload length
+POSITION_HEADER = struct.Struct('<BI')      # flags, occupied squares
+GAME_HEADER = struct.Struct('<BH')          # result, turns number
+
+
+class RECORD_TYPE:
+    POSITION = 1
+    GAME = 2
+
+
+class RESULT:
+    UNKNOWN = 0
+    WHITE = 1
+    BLACK = 2
+    DRAW = 3
+
+    BY_WINNER = {None: UNKNOWN, Checker.WHITE: WHITE, Checker.BLACK: BLACK, 'draw': DRAW}
+    WINNERS = dict((value, key) for key, value in BY_WINNER.items())
+
+
+_BLACK_TO_MOVE = 1
+
+PositionRecord = namedtuple('PositionRecord', 'board color')
+GameRecord = namedtuple('GameRecord', 'board color paths winner')     # see encode_game
+
+
+class RecordError(Exception):
+    """
+    Wrong records file
+    """
+
+
+def encode_position(position, color):
+    """
+    return str with Position and color to move
+    """
+    occupied = position.white | position.black
+    flags = _BLACK_TO_MOVE if color == Checker.BLACK else 0
+    pieces = bytearray((bin(occupied).count('1') * 2 + 7) // 8)
+    for i, sq in enumerate(iter_squares(occupied)):
+        bit = 1 << sq
+        value = (2 if position.black & bit else 0) | (1 if position.kings & bit else 0)
+        pieces[i // 4] |= value << (i % 4 * 2)
+    return POSITION_HEADER.pack(flags, occupied) + str(pieces)
+
+
+def decode_position(data, offset=0):
+    """
+    return (Position, color to move, offset after position)
+    """
+    flags, occupied = POSITION_HEADER.unpack_from(data, offset)
+    offset += POSITION_HEADER.size
+    squares = list(iter_squares(occupied))
+    pieces = bytearray(data[offset:offset + (len(squares) * 2 + 7) // 8])
+    white = black = kings = 0
+    for i, sq in enumerate(squares):
+        value = pieces[i // 4] >> (i % 4 * 2) & 3
+        if value & 2:
+            black |= 1 << sq
+        else:
+            white |= 1 << sq
+        if value & 1:
+            kings |= 1 << sq
+    color = Checker.BLACK if flags & _BLACK_TO_MOVE else Checker.WHITE
+    return Position(white, black, kings), color, offset + len(pieces)
+
+
+def encode_game(board, color, paths, winner=None):
+    """
+    paths: [((x, y), ...), ...] fields of moved checker in every turn, e.g. MovePath.path
+    winner: Checker.WHITE, Checker.BLACK, 'draw' or None if unknown
+    """
+    turns = []
+    for path in paths:
+        turns.append(chr(len(path)))
+        turns.append(''.join(chr(square(x, y)) for x, y in path))
+    return (encode_position(Position.from_board(board), color) +
+            GAME_HEADER.pack(RESULT.BY_WINNER[winner], len(paths)) + ''.join(turns))
+
+
+def decode_game(data, offset=0):
+    """
+    return GameRecord
+    """
+    position, color, offset = decode_position(data, offset)
+    result, turns_number = GAME_HEADER.unpack_from(data, offset)
+    offset += GAME_HEADER.size
+    paths = []
+    for _ in xrange(turns_number):
+        length = ord(data[offset])
+        paths.append(tuple(square_coords(ord(sq)) for sq in data[offset + 1:offset + 1 + length]))
+        offset += 1 + length
+    return GameRecord(position.to_board(), color, paths, RESULT.WINNERS[result])
+
+
+class RecordWriter(object):
+    """
+    Appends records to file object opened for binary writing.
+    """
+
+    def __init__(self, f):
+        self.file = f
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            f.write(MAGIC)
+        self.records = 0
+
+    def write_position(self, board, color=Checker.WHITE):
+        self._write_record(RECORD_TYPE.POSITION, encode_position(Position.from_board(board), color))
+
+    def write_game(self, board, color, paths, winner=None):
+        self._write_record(RECORD_TYPE.GAME, encode_game(board, color, paths, winner))
+
+    def _write_record(self, record_type, payload):
+        self.file.write(RECORD_HEADER.pack(record_type, len(payload)))
+        self.file.write(payload)
+        self.records += 1
+
+
+class RecordReader(object):
+    """
+    Iterates PositionRecord and GameRecord of file object opened for binary reading, one record is read at a time.
+    """
+
+    def __init__(self, f):
+        self.file = f
+        if f.read(len(MAGIC)) != MAGIC:
+            raise RecordError('%s is not a records file.' % getattr(f, 'name', f))
+
+    def __iter__(self):
+        while True:
+            header = self.file.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) < RECORD_HEADER.size:
+                raise RecordError('Record is truncated.')
+
+            record_type, length = RECORD_HEADER.unpack(header)
+            payload = self.file.read(length)
+            if len(payload) < length:
+                raise RecordError('Record is truncated.')
+
+            if record_type == RECORD_TYPE.POSITION:
+                position, color, _ = decode_position(payload)
+                yield PositionRecord(position.to_board(), color)
+            elif record_type == RECORD_TYPE.GAME:
+                yield decode_game(payload)
+            # unknown record types are skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack boards to records file or dump it.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    pack_parser = subparsers.add_parser('pack')
+    pack_parser.add_argument('records')
+    pack_parser.add_argument('boards', nargs='+')
+    pack_parser.add_argument('--color', default=Checker.WHITE, choices=[Checker.WHITE, Checker.BLACK])
+
+    dump_parser = subparsers.add_parser('dump')
+    dump_parser.add_argument('records')
+
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        with open(args.records, 'ab') as f:
+            writer = RecordWriter(f)
+            for board_filename in args.boards:
+                writer.write_position(load_board_from_file(board_filename), args.color)
+        print '%d positions packed' % writer.records
+    else:
+        with open(args.records, 'rb') as f:
+            for record in RecordReader(f):
+                print '%s to move:' % record.color
+                print save_board(record.board)
+                if isinstance(record, GameRecord):
+                    print 'turns: %s' % ' '.join('-'.join(field_verbose(*field) for field in path)
+                                                 for path in record.paths)
+                    print 'winner: %s' % record.winner
+
+
+if __name__ == '__main__':
+    main()
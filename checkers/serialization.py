@@ -9,6 +9,7 @@ def save_board(board):
             'color': checker.color,
             'x': checker.x,
             'y': checker.y,
+            'is_king': checker.is_king,
         }
         for checker in board.checkers
     ]
@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+Local analysis service for many simultaneous games: JSON requests over TCP or Unix socket, searches in a
+bounded process pool.
+
+Every connection sends and receives one JSON object per line, responses may come in other order than requests:
+    {"id": 1, "game": "g1", "board": {"checkers": [...]}, "color": "white", "depth": 6, "time": 1.0, "deadline": 2.0}
+    -> {"id": 1, "move": "c3-d4", "path": [[2, 2], [3, 3]], "score": 2, "depth": 6, "nodes": 1234, "latency": 0.2}
+    {"id": 2, "command": "stats"}
+    -> {"id": 2, "queue": 3, "running": 4, "completed": 100, "rejected": 0, "expired": 1, "latency": {...}}
+board is as in checkers.serialization, depth, time (seconds of search) and deadline (seconds from receiving the
+request to the response) are optional. Errors are returned as {"id": 1, "error": "..."}.
+
+Requests are queued by games and taken from games in turn, so a game sending many requests doesn't delay the
+others. The queue is bounded, requests are rejected with "busy" error when it is full. No more searches than
+processes are sent to the pool, so queued requests wait in the fair queue, not in the pool one. Search time is cut
+to the deadline, requests which have not started before their deadlines get "deadline exceeded" error.
+
+Python 2 has no asyncio, connections are served by threads of SocketServer, searches are run by multiprocessing.
+
+Usage:
+    python -m checkers.service serve --port 8765 --processes 4 --max-queue 1000
+    python -m checkers.service bench --games 16 --turns 20 --depth 4
+"""
+import argparse
+import json
+import socket
+import threading
+from collections import OrderedDict, deque, namedtuple
+from multiprocessing import Pool, cpu_count
+from SocketServer import StreamRequestHandler, TCPServer, ThreadingMixIn, UnixStreamServer
+from time import time
+
+from checkers.ai import Search, DEFAULT_DEPTH, MAX_DEPTH
+from checkers.logic import Game
+from checkers.models import BoardError, Checker
+from checkers.serialization import load_board, save_board
+from checkers.transposition import TranspositionTable
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE = 1000
+LATENCY_SAMPLES = 1000      # percentiles are computed over this many last responses
+PERCENTILES = (50, 90, 99)
+
+Job = namedtuple('Job', 'id game task received deadline reply')
+
+_worker_table = None    # transposition table kept by worker between tasks of all games
+
+
+class ServiceBusy(Exception):
+    """
+    Requests queue is full
+    """
+
+
+def _init_worker():
+    global _worker_table
+    _worker_table = TranspositionTable()
+
+
+def _analyse(task):
+    # exceptions are returned, apply_async of python 2 has no error callback
+    checkers_data, color, depth, time_limit = task
+    try:
+        search = Search(load_board(checkers_data), _worker_table, time_limit)
+        result = search.iterative_deepening(color, depth, random_choice=False)
+    except Exception, e:
+        return {'error': str(e)}
+
+    if result.move is None:
+        return {'move': None, 'path': None, 'score': result.score, 'depth': result.depth, 'nodes': result.nodes}
+    return {'move': str(result.move), 'path': result.move.path, 'score': result.score, 'depth': result.depth,
+            'nodes': result.nodes}
+
+
+class FairQueue(object):
+    """
+    Bounded queue of jobs taken from games in turn.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_QUEUE):
+        self.max_size = max_size
+        self._queues = OrderedDict()    # game -> deque of its jobs, game served next goes first
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def put(self, game, job):
+        with self._condition:
+            if self._size >= self.max_size:
+                raise ServiceBusy('busy')
+            self._queues.setdefault(game, deque()).append(job)
+            self._size += 1
+            self._condition.notify()
+
+    def get(self):
+        """
+        return the next job, wait for it if queue is empty, None after close
+        """
+        with self._condition:
+            while not self._size and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+
+            game, jobs = self._queues.popitem(last=False)
+            job = jobs.popleft()
+            if jobs:
+                self._queues[game] = jobs   # the game goes to the end of turn
+            self._size -= 1
+            return job
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class AnalysisService(object):
+    """
+    Fair queue and process pool shared by all connections, call close when it is not needed anymore.
+    """
+
+    def __init__(self, processes=None, max_queue=DEFAULT_MAX_QUEUE):
+        self.processes = processes or cpu_count()
+        self.queue = FairQueue(max_queue)
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.processes)
+        self._pool = Pool(self.processes, _init_worker)
+
+        self._dispatcher = threading.Thread(target=self._dispatch)
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def handle_request(self, request, reply):
+        """
+        request: dict of one request line
+        reply: called with response dict, from other thread for searches
+        """
+        request_id = request.get('id')
+        if request.get('command') == 'stats':
+            response = self.get_stats()
+            response['id'] = request_id
+            reply(response)
+            return
+
+        received = time()
+        try:
+            checkers_data = request['board']['checkers']
+            load_board(checkers_data)   # validated here, so bad requests don't take pool time
+            game = request.get('game', '')
+            if not isinstance(game, basestring):
+                raise ValueError('Wrong game %r.' % game)
+            color = request.get('color', Checker.WHITE)
+            if color not in (Checker.WHITE, Checker.BLACK):
+                raise ValueError('Wrong color %r.' % color)
+            depth = request.get('depth')
+            time_limit = request.get('time')
+            deadline = received + request['deadline'] if request.get('deadline') is not None else None
+        except (BoardError, KeyError, TypeError, ValueError), e:
+            reply({'id': request_id, 'error': 'wrong request: %s' % e})
+            return
+
+        if depth is None:
+            depth = MAX_DEPTH if time_limit is not None or deadline is not None else DEFAULT_DEPTH
+        job = Job(request_id, game, (checkers_data, color, depth, time_limit), received,
+                  deadline, reply)
+        try:
+            self.queue.put(job.game, job)
+        except ServiceBusy, e:
+            with self._lock:
+                self.rejected += 1
+            reply({'id': request_id, 'error': str(e)})
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()
+            job = self.queue.get()
+            if job is None:
+                return
+
+            checkers_data, color, depth, time_limit = job.task
+            if job.deadline is not None:
+                remaining = job.deadline - time()
+                if remaining <= 0:
+                    with self._lock:
+                        self.expired += 1
+                    self._slots.release()
+                    job.reply({'id': job.id, 'error': 'deadline exceeded'})
+                    continue
+                time_limit = min(time_limit, remaining) if time_limit is not None else remaining
+
+            with self._lock:
+                self.running += 1
+            self._pool.apply_async(_analyse, ((checkers_data, color, depth, time_limit),),
+                                   callback=lambda response, job=job: self._finish(job, response))
+
+    def _finish(self, job, response):
+        # called by result thread of pool
+        latency = time() - job.received
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+            self._latencies.append(latency)
+        self._slots.release()
+
+        response['id'] = job.id
+        response['latency'] = latency
+        job.reply(response)
+
+    def get_stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'queue': len(self.queue),
+                'running': self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'expired': self.expired,
+                'latency': dict(('p%d' % percentile, get_percentile(latencies, percentile))
+                                for percentile in PERCENTILES),
+            }
+
+    def close(self):
+        self.queue.close()
+        self._pool.terminate()
+        self._pool.join()
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    Nearest rank percentile, None for no values.
+    """
+    if not sorted_values:
+        return None
+    index = max(0, int(round(percentile / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+class _RequestHandler(StreamRequestHandler):
+    def handle(self):
+        write_lock = threading.Lock()
+
+        def reply(response):
+            with write_lock:
+                try:
+                    self.wfile.write(json.dumps(response) + '\n')
+                    self.wfile.flush()
+                except (socket.error, ValueError):
+                    pass    # client has disconnected
+
+        for line in iter(self.rfile.readline, ''):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('Object is expected.')
+            except ValueError, e:
+                reply({'id': None, 'error': 'wrong request: %s' % e})
+                continue
+            self.server.service.handle_request(request, reply)
+
+
+class AnalysisServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service):
+        TCPServer.__init__(self, address, _RequestHandler)
+        self.service = service
+
+
+class UnixAnalysisServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        UnixStreamServer.__init__(self, path, _RequestHandler)
+        self.service = service
+
+
+class AnalysisClient(object):
+    """
+    Blocking client of the service, address is (host, port) or path of Unix socket.
+    """
+
+    def __init__(self, address):
+        family = socket.AF_UNIX if isinstance(address, basestring) else socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.connect(address)
+        self._file = self._socket.makefile('rb')
+        self._next_id = 0
+
+    def send(self, request):
+        """
+        Send request without waiting for the response, return its id.
+        """
+        self._next_id += 1
+        request = dict(request, id=self._next_id)
+        self._socket.sendall(json.dumps(request) + '\n')
+        return self._next_id
+
+    def receive(self):
+        line = self._file.readline()
+        if not line:
+            raise socket.error('Connection is closed.')
+        return json.loads(line)
+
+    def analyse(self, board, color, game='', depth=None, time_limit=None, deadline=None):
+        """
+        return response dict of one search
+        """
+        request = {'game': game, 'board': json.loads(save_board(board)), 'color': color}
+        for key, value in (('depth', depth), ('time', time_limit), ('deadline', deadline)):
+            if value is not None:
+                request[key] = value
+        request_id = self.send(request)
+        return self._receive_response(request_id)
+
+    def get_stats(self):
+        return self._receive_response(self.send({'command': 'stats'}))
+
+    def _receive_response(self, request_id):
+        while True:
+            response = self.receive()
+            if response.get('id') == request_id:
+                return response
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+def _play_game(address, game_id, board_filename, turns, depth, time_limit, deadline, results):
+    client = AnalysisClient(address)
+    game = Game(board_filename)
+    errors = 0
+    try:
+        for _ in xrange(turns):
+            if game.get_winner():
+                break
+            response = client.analyse(game.board, game.current_player.color, game_id, depth, time_limit,
+                                      deadline)
+            if 'error' in response or response['path'] is None:
+                errors += 'error' in response
+                break
+            path = response['path']
+            for (x1, y1), (x2, y2) in zip(path, path[1:]):
+                game.current_player.move(game.board.get_checker_in_position(x1, y1), x2, y2)
+    finally:
+        client.close()
+    results.append((len(game.history), errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analysis service for many simultaneous games.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--unix', default=None, help='path of Unix socket instead of TCP')
+
+    bench_parser = subparsers.add_parser('bench', help='play games through local service on a free port')
+    bench_parser.add_argument('board', nargs='?', default='boards/default.json')
+    bench_parser.add_argument('--games', type=int, default=16)
+    bench_parser.add_argument('--turns', type=int, default=20)
+    bench_parser.add_argument('--depth', type=int, default=4)
+    bench_parser.add_argument('--time', type=float, default=None)
+    bench_parser.add_argument('--deadline', type=float, default=None)
+
+    for subparser in (serve_parser, bench_parser):
+        subparser.add_argument('--processes', type=int, default=None)
+        subparser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE)
+    args = parser.parse_args()
+
+    service = AnalysisService(args.processes, args.max_queue)
+    try:
+        if args.command == 'serve':
+            if args.unix:
+                server = UnixAnalysisServer(args.unix, service)
+            else:
+                server = AnalysisServer((args.host, args.port), service)
+            server.serve_forever()
+            return
+
+        server = AnalysisServer(('127.0.0.1', 0), service)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+        start_time = time()
+        results = []
+        threads = [threading.Thread(target=_play_game,
+                                    args=(server.server_address, 'game%d' % i, args.board, args.turns, args.depth,
+                                          args.time, args.deadline, results))
+                   for i in xrange(args.games)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time() - start_time
+        server.shutdown()
+
+        stats = service.get_stats()
+        turns = sum(game_turns for game_turns, _ in results)
+        print '%d games, %d turns in %.1fs (%.1f turns/s), %d errors, %d rejected, %d expired' % (
+            len(results), turns, elapsed, turns / elapsed, sum(errors for _, errors in results), stats['rejected'],
+            stats['expired'])
+        print 'latency: %s' % ', '.join('%s %.3fs' % (name, stats['latency'][name] or 0.0)
+                                        for name in sorted(stats['latency']))
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
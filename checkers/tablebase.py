@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Endgame tablebase: result and distance to the end of game for every position with few checkers.
+
+Tables are built by retrograde analysis, from positions with less checkers to positions with more ones. Only
+positions with white to move are stored: a position with black to move is looked up turned by 180 degrees with
+swapped colors (Position.flipped).
+
+Every material signature (white men, white kings, black men, black kings) is a file
+<white men><white kings><black men><black kings>.tb in tablebase directory: a header and uint16 value for every
+index, value is distance in turns << 2 | result. Files are memory-mapped on probe.
+
+Usage:
+    python -m checkers.tablebase build tablebase --pieces 4 --processes 4
+"""
+import argparse
+import mmap
+import os
+import struct
+from array import array
+from multiprocessing import Pool
+
+from checkers.bitboard import Position, KING_LINE, FULL_MASK, iter_squares
+from checkers.models import Checker
+
+MAGIC = 'CHKTB001'
+HEADER = struct.Struct('<8s4BI')     # magic, signature, size
+VALUE = struct.Struct('<H')
+
+DEFAULT_PIECES = 4
+
+
+class RESULT:
+    UNKNOWN = 0     # also not valid index
+    WIN = 1
+    LOSS = 2
+    DRAW = 3
+
+
+class TablebaseError(Exception):
+    """
+    Wrong tablebase file
+    """
+
+
+def _create_binomials(n):
+    binomials = [[0] * (n + 1) for _ in xrange(n + 1)]
+    for i in xrange(n + 1):
+        binomials[i][0] = 1
+        for j in xrange(1, i + 1):
+            binomials[i][j] = binomials[i - 1][j - 1] + binomials[i - 1][j]
+    return binomials
+
+
+_BINOMIALS = _create_binomials(32)
+
+# squares where checkers of every group may stand
+WHITE_MEN_SQUARES = tuple(iter_squares(FULL_MASK & ~KING_LINE[Checker.WHITE]))
+BLACK_MEN_SQUARES = tuple(iter_squares(FULL_MASK & ~KING_LINE[Checker.BLACK]))
+KING_SQUARES = tuple(iter_squares(FULL_MASK))
+_GROUP_SQUARES = (WHITE_MEN_SQUARES, KING_SQUARES, BLACK_MEN_SQUARES, KING_SQUARES)
+
+
+def get_signature(position):
+    white_men = position.white & ~position.kings
+    black_men = position.black & ~position.kings
+    return (bin(white_men).count('1'), bin(position.white & position.kings).count('1'),
+            bin(black_men).count('1'), bin(position.black & position.kings).count('1'))
+
+
+def swap_signature(signature):
+    white_men, white_kings, black_men, black_kings = signature
+    return black_men, black_kings, white_men, white_kings
+
+
+def get_table_size(signature):
+    size = 1
+    for number, squares in zip(signature, _GROUP_SQUARES):
+        size *= _BINOMIALS[len(squares)][number]
+    return size
+
+
+def _group_masks(position):
+    return (position.white & ~position.kings, position.white & position.kings,
+            position.black & ~position.kings, position.black & position.kings)
+
+
+def get_index(position, signature):
+    """
+    Every group of checkers is ranked as combination of its squares, checkers of different groups may overlap
+    in index space, such indexes are not valid positions.
+    """
+    index = 0
+    for mask, number, squares in zip(_group_masks(position), signature, _GROUP_SQUARES):
+        rank = 0
+        for i, sq in enumerate(iter_squares(mask)):
+            rank += _BINOMIALS[squares.index(sq)][i + 1]
+        index = index * _BINOMIALS[len(squares)][number] + rank
+    return index
+
+
+def get_position(index, signature):
+    """
+    return Position of index or None if index is not valid
+    """
+    masks = []
+    for number, squares in reversed(zip(signature, _GROUP_SQUARES)):
+        combinations = _BINOMIALS[len(squares)][number]
+        index, rank = divmod(index, combinations)
+        mask = 0
+        position = len(squares)
+        for i in xrange(number, 0, -1):
+            position -= 1
+            while _BINOMIALS[position][i] > rank:
+                position -= 1
+            rank -= _BINOMIALS[position][i]
+            mask |= 1 << squares[position]
+        masks.append(mask)
+
+    black_kings, black_men, white_kings, white_men = masks
+    if sum(bin(mask).count('1') for mask in masks) != bin(white_men | white_kings | black_men | black_kings).count('1'):
+        return None
+    return Position(white_men | white_kings, black_men | black_kings, white_kings | black_kings)
+
+
+def get_signatures(max_pieces):
+    """
+    return [[signature, ...], ...] grouped in levels, turns of a level lead only into previous levels or itself
+    """
+    levels = {}
+    for pieces in xrange(2, max_pieces + 1):
+        for white_pieces in xrange(1, pieces):
+            black_pieces = pieces - white_pieces
+            for white_men in xrange(white_pieces + 1):
+                for black_men in xrange(black_pieces + 1):
+                    signature = (white_men, white_pieces - white_men, black_men, black_pieces - black_men)
+                    levels.setdefault((pieces, white_men + black_men), []).append(signature)
+    return [levels[level] for level in sorted(levels)]
+
+
+def _table_filename(directory, signature):
+    return os.path.join(directory, '%d%d%d%d.tb' % signature)
+
+
+class Tablebase(object):
+    """
+    Probes tablebase files, every file is memory-mapped on the first probe of its signature.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.max_pieces = 0
+        for filename in os.listdir(directory):
+            if filename.endswith('.tb'):
+                self.max_pieces = max(self.max_pieces, sum(int(c) for c in filename[:-len('.tb')]))
+        self._tables = {}   # signature -> mmap or None
+
+        self.hits = 0
+
+    def probe(self, board, color):
+        """
+        return (RESULT, distance in turns) for color to move or None if position isn't in tablebase
+        """
+        if board.get_checkers_number() > self.max_pieces:
+            return None
+        return self.probe_position(Position.from_board(board), color)
+
+    def probe_position(self, position, color):
+        if color == Checker.BLACK:
+            position = position.flipped()
+        if not position.white or not position.black:
+            return None
+
+        signature = get_signature(position)
+        table = self._get_table(signature)
+        if table is None:
+            return None
+
+        value = VALUE.unpack_from(table, HEADER.size + get_index(position, signature) * VALUE.size)[0]
+        result = value & 3
+        if result == RESULT.UNKNOWN:
+            return None
+        self.hits += 1
+        return result, value >> 2
+
+    def _get_table(self, signature):
+        if signature not in self._tables:
+            filename = _table_filename(self.directory, signature)
+            table = None
+            if os.path.exists(filename):
+                with open(filename, 'rb') as f:
+                    table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, white_men, white_kings, black_men, black_kings, size = HEADER.unpack_from(table, 0)
+                if magic != MAGIC or (white_men, white_kings, black_men, black_kings) != signature:
+                    raise TablebaseError('%s is not a tablebase file.' % filename)
+            self._tables[signature] = table
+        return self._tables[signature]
+
+    def close(self):
+        for table in self._tables.itervalues():
+            if table is not None:
+                table.close()
+        self._tables = {}
+
+
+def solve(signature, directory):
+    """
+    Compute table of signature and table of swapped signature, turns from one lead to the other.
+    Tables of previous levels must be in directory already, TablebaseError is raised otherwise.
+    """
+    signatures = [signature] if swap_signature(signature) == signature else [signature, swap_signature(signature)]
+    offsets = {}
+    total_size = 0
+    for part_signature in signatures:
+        offsets[part_signature] = total_size
+        total_size += get_table_size(part_signature)
+
+    results = array('B', [RESULT.UNKNOWN]) * total_size
+    distances = array('H', [0]) * total_size
+    # turns into tables of previous levels, distances are for the player to move
+    exit_wins = {}      # index -> shortest win
+    exit_losses = {}    # index -> longest loss
+    exit_draws = set()
+    successor_starts = array('I', [0]) * (total_size + 1)
+    successors = array('I')
+    unsolved = []
+    max_exit_distance = 0
+
+    tablebase = Tablebase(directory)
+    for part_signature in signatures:
+        offset = offsets[part_signature]
+        for index in xrange(get_table_size(part_signature)):
+            i = offset + index
+            successor_starts[i] = len(successors)
+            position = get_position(index, part_signature)
+            if position is None:
+                continue
+
+            move_paths = position.get_move_paths(Checker.WHITE)
+            if not move_paths:
+                results[i] = RESULT.LOSS
+                continue
+
+            for _, next_position in move_paths:
+                next_position = next_position.flipped()
+                next_signature = get_signature(next_position)
+                if next_signature in offsets:
+                    successors.append(offsets[next_signature] + get_index(next_position, next_signature))
+                    continue
+
+                if not next_position.white:
+                    next_result = RESULT.LOSS, 0
+                else:
+                    next_result = tablebase.probe_position(next_position, Checker.WHITE)
+                    if next_result is None:
+                        tablebase.close()
+                        raise TablebaseError('Table %s is missing, previous levels must be solved first.' %
+                                             _table_filename(directory, next_signature))
+                result, distance = next_result
+                if result == RESULT.LOSS:
+                    exit_wins[i] = min(exit_wins.get(i, distance + 1), distance + 1)
+                elif result == RESULT.WIN:
+                    exit_losses[i] = max(exit_losses.get(i, 0), distance + 1)
+                else:
+                    exit_draws.add(i)
+                max_exit_distance = max(max_exit_distance, distance + 1)
+            unsolved.append(i)
+    successor_starts[total_size] = len(successors)
+    tablebase.close()
+
+    # pass n finds positions won or lost in exactly n turns
+    distance = 0
+    solved_last_pass = True
+    while unsolved and (solved_last_pass or distance <= max_exit_distance):
+        distance += 1
+        solved = []
+        still_unsolved = []
+        for i in unsolved:
+            best_win = exit_wins.get(i)
+            longest_loss = exit_losses.get(i, 0)
+            all_lost = i not in exit_draws and best_win is None
+            for j in xrange(successor_starts[i], successor_starts[i + 1]):
+                successor = successors[j]
+                next_result = results[successor]
+                if next_result == RESULT.LOSS:
+                    if best_win is None or distances[successor] + 1 < best_win:
+                        best_win = distances[successor] + 1
+                elif next_result == RESULT.WIN:
+                    longest_loss = max(longest_loss, distances[successor] + 1)
+                else:
+                    all_lost = False
+
+            if best_win == distance:
+                solved.append((i, RESULT.WIN))
+            elif all_lost and longest_loss == distance:
+                solved.append((i, RESULT.LOSS))
+            else:
+                still_unsolved.append(i)
+
+        # results of this pass are set after it, so every position of the pass sees the same previous passes
+        for i, result in solved:
+            results[i] = result
+            distances[i] = distance
+        unsolved = still_unsolved
+        solved_last_pass = bool(solved)
+
+    # nobody can force the end of game from the rest
+    for i in unsolved:
+        results[i] = RESULT.DRAW
+
+    for part_signature in signatures:
+        offset = offsets[part_signature]
+        size = get_table_size(part_signature)
+        values = array('H', [0]) * size
+        for index in xrange(size):
+            if results[offset + index]:
+                values[index] = distances[offset + index] << 2 | results[offset + index]
+        _write_table(directory, part_signature, values)
+
+
+def _write_table(directory, signature, values):
+    # write and rename, so interrupted generation never leaves broken table
+    filename = _table_filename(directory, signature)
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, signature[0], signature[1], signature[2], signature[3], len(values)))
+        values.tofile(f)
+    os.rename(temp_filename, filename)
+
+
+def _solve_job(args):
+    signature, directory = args
+    solve(signature, directory)
+    return signature
+
+
+def generate(directory, max_pieces=DEFAULT_PIECES, processes=1, log=None):
+    """
+    Build all tables up to max_pieces checkers, tables existing in directory are kept, so generation can be
+    restarted. Tables of one level are independent and are solved in parallel.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    pool = Pool(processes) if processes > 1 else None
+    try:
+        for level in get_signatures(max_pieces):
+            jobs = []
+            for signature in level:
+                if signature > swap_signature(signature) and swap_signature(signature) in level:
+                    continue    # solved together with swapped signature
+                # tables of a job are written one by one, so generation may be interrupted between them
+                swapped = swap_signature(signature)
+                filenames = (_table_filename(directory, signature), _table_filename(directory, swapped))
+                if not all(os.path.exists(filename) for filename in filenames):
+                    jobs.append((signature, directory))
+
+            solved = pool.imap_unordered(_solve_job, jobs) if pool else (_solve_job(job) for job in jobs)
+            for signature in solved:
+                if log:
+                    log('%d%d%d%d solved' % signature)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build endgame tablebase.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    build_parser = subparsers.add_parser('build')
+    build_parser.add_argument('directory')
+    build_parser.add_argument('--pieces', type=int, default=DEFAULT_PIECES)
+    build_parser.add_argument('--processes', type=int, default=1)
+
+    args = parser.parse_args()
+
+    def log(msg):
+        print msg
+
+    generate(args.directory, args.pieces, args.processes, log)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Headless engine against engine games, played in a process pool without Qt.
+
+Every start position is played twice, engines swap colors in the second game. One JSON line is written per
+finished game, the summary goes to stderr.
+
+Engines are given as comma separated settings: name, depth, time (seconds per turn), nodes, book, tablebase,
+processes (root-parallel search, see checkers.parallel, games must be played with --processes 1 then).
+
+Usage:
+    python -m checkers.tournament boards/default.json --games 100 --processes 4 \\
+        --engine name=old,depth=4 --engine name=new,depth=6,time=0.5 --output results.jsonl
+"""
+import argparse
+import json
+import random
+import sys
+from collections import namedtuple
+from multiprocessing import Pool, cpu_count
+from time import time
+
+from checkers.ai import search_ai_move, DEFAULT_DEPTH
+from checkers.book import OpeningBook
+from checkers.logic import Game
+from checkers.models import Checker
+from checkers.parallel import ParallelSearch
+from checkers.tablebase import Tablebase
+from checkers.transposition import TranspositionTable
+
+DEFAULT_MAX_TURNS = 200     # the game is a draw after this many turns
+REPETITIONS = 3             # the game is a draw when a position is repeated this many times
+
+Engine = namedtuple('Engine', 'name depth time_limit node_limit book tablebase processes')
+
+_ENGINE_KEYS = {
+    'name': ('name', str),
+    'depth': ('depth', int),
+    'time': ('time_limit', float),
+    'nodes': ('node_limit', int),
+    'book': ('book', str),
+    'tablebase': ('tablebase', str),
+    'processes': ('processes', int),
+}
+
+
+def parse_engine(text, default_name):
+    """
+    'name=new,depth=6,time=0.5' -> Engine
+    """
+    settings = {'name': default_name, 'depth': DEFAULT_DEPTH, 'time_limit': None, 'node_limit': None,
+                'book': None, 'tablebase': None, 'processes': None}
+    for item in filter(None, text.split(',')):
+        key, _, value = item.partition('=')
+        if key not in _ENGINE_KEYS:
+            raise ValueError('Unknown engine setting %r.' % key)
+        field, convert = _ENGINE_KEYS[key]
+        settings[field] = convert(value) if value != 'none' else None
+    return Engine(**settings)
+
+
+# books and tablebases opened by worker process, shared by its games
+_opened_books = {}
+_opened_tablebases = {}
+
+
+def _open_book(filename):
+    if filename and filename not in _opened_books:
+        _opened_books[filename] = OpeningBook(filename)
+    return _opened_books.get(filename)
+
+
+def _open_tablebase(directory):
+    if directory and directory not in _opened_tablebases:
+        _opened_tablebases[directory] = Tablebase(directory)
+    return _opened_tablebases.get(directory)
+
+
+def play_game(board_filename, white_engine, black_engine, max_turns=DEFAULT_MAX_TURNS):
+    """
+    return {'result': 'white'|'black'|'draw', 'turns': ..., 'white': engine stats, 'black': engine stats}
+    """
+    game = Game(board_filename)
+    engines = {Checker.WHITE: white_engine, Checker.BLACK: black_engine}
+    tables = dict((color, TranspositionTable()) for color in engines)
+    parallel_searches = dict((color, ParallelSearch(engine.processes, engine.tablebase))
+                             for color, engine in engines.iteritems() if engine.processes > 1)
+    stats = dict((color, {'engine': engines[color].name, 'turns': 0, 'nodes': 0, 'time': 0.0}) for color in engines)
+    repetitions = {}
+
+    result = 'draw'
+    turns = 0
+    try:
+        while turns < max_turns:
+            color = game.current_player.color
+            winner = game.get_winner()
+            if winner:
+                result = winner
+                break
+
+            key = game.board.get_hash(color)
+            repetitions[key] = repetitions.get(key, 0) + 1
+            if repetitions[key] >= REPETITIONS:
+                break
+
+            engine = engines[color]
+            search_result = search_ai_move(game.board, color, engine.depth, True, tables[color], engine.time_limit,
+                                           engine.node_limit, _open_book(engine.book),
+                                           _open_tablebase(engine.tablebase),
+                                           parallel_search=parallel_searches.get(color))
+            if search_result.move is None:
+                result = Checker.BLACK if color == Checker.WHITE else Checker.WHITE
+                break
+
+            for x1, y1, x2, y2 in search_result.move.hops:
+                game.current_player.move(game.board.get_checker_in_position(x1, y1), x2, y2)
+
+            turns += 1
+            color_stats = stats[color]
+            color_stats['turns'] += 1
+            color_stats['nodes'] += search_result.nodes
+            color_stats['time'] += search_result.elapsed
+    finally:
+        for parallel_search in parallel_searches.itervalues():
+            parallel_search.close()
+
+    for color_stats in stats.itervalues():
+        color_stats['average_latency'] = color_stats['time'] / color_stats['turns'] if color_stats['turns'] else 0.0
+        color_stats['nodes_per_second'] = color_stats['nodes'] / color_stats['time'] if color_stats['time'] else 0.0
+        del color_stats['time']
+
+    return {
+        'result': result,
+        'turns': turns,
+        Checker.WHITE: stats[Checker.WHITE],
+        Checker.BLACK: stats[Checker.BLACK],
+    }
+
+
+def _play_game_job(args):
+    index, seed, board_filename, white_engine, black_engine, max_turns = args
+    # seeded, so a game can be replayed with the same seed if engines have no time limits
+    random.seed(seed)
+    record = play_game(board_filename, white_engine, black_engine, max_turns)
+    record['game'] = index
+    record['seed'] = seed
+    record['board'] = board_filename
+    return record
+
+
+def iter_games(board_filenames, engines, games, seed=0, max_turns=DEFAULT_MAX_TURNS):
+    """
+    Yield job arguments, start positions are taken in turn and every one is played with both color orders.
+    """
+    first_engine, second_engine = engines
+    for index in xrange(games):
+        board_filename = board_filenames[index // 2 % len(board_filenames)]
+        if index % 2:
+            yield index, seed + index, board_filename, second_engine, first_engine, max_turns
+        else:
+            yield index, seed + index, board_filename, first_engine, second_engine, max_turns
+
+
+def run_tournament(board_filenames, engines, games, processes=None, seed=0, max_turns=DEFAULT_MAX_TURNS):
+    """
+    Yield game records as soon as games are finished.
+    """
+    jobs = iter_games(board_filenames, engines, games, seed, max_turns)
+    if processes == 1:
+        for job in jobs:
+            yield _play_game_job(job)
+        return
+
+    pool = Pool(processes or cpu_count())
+    try:
+        for record in pool.imap_unordered(_play_game_job, jobs):
+            yield record
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class Summary(object):
+    """
+    Score of engines by their names.
+    """
+
+    def __init__(self, engines):
+        self.engines = [engine.name for engine in engines]
+        self.wins = dict.fromkeys(self.engines, 0)
+        self.draws = 0
+        self.games = 0
+        self.turns = 0
+
+    def add(self, record):
+        self.games += 1
+        self.turns += record['turns']
+        if record['result'] == 'draw':
+            self.draws += 1
+        else:
+            self.wins[record[record['result']]['engine']] += 1
+
+    def __str__(self):
+        first, second = self.engines
+        return '%s - %s: %d wins, %d draws, %d losses in %d games, %.1f turns per game' % (
+            first, second, self.wins[first], self.draws, self.wins[second], self.games,
+            float(self.turns) / self.games if self.games else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play engine against engine games.')
+    parser.add_argument('boards', nargs='*', default=['boards/default.json'],
+                        help='start positions, white moves first')
+    parser.add_argument('--engine', action='append', default=[],
+                        help='engine settings, e.g. name=new,depth=6,time=0.5,book=boards/default.book')
+    parser.add_argument('--games', type=int, default=2)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-turns', type=int, default=DEFAULT_MAX_TURNS)
+    parser.add_argument('--output', default=None, help='JSONL file, stdout by default')
+    args = parser.parse_args()
+
+    engine_texts = args.engine + [''] * (2 - len(args.engine))
+    if len(engine_texts) != 2:
+        parser.error('Give settings of two engines.')
+    engines = [parse_engine(text, default_name) for text, default_name in zip(engine_texts, ('first', 'second'))]
+    if engines[0].name == engines[1].name:
+        parser.error('Engines must have different names.')
+    if args.processes != 1 and any(engine.processes > 1 for engine in engines):
+        parser.error('Engines with processes can play only with --processes 1, pool workers can\'t start pools.')
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    summary = Summary(engines)
+    start_time = time()
+    try:
+        for record in run_tournament(args.boards, engines, args.games, args.processes, args.seed, args.max_turns):
+            output.write(json.dumps(record, sort_keys=True) + '\n')
+            output.flush()
+            summary.add(record)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    sys.stderr.write('%s, %.1fs\n' % (summary, time() - start_time))
+
+
+if __name__ == '__main__':
+    main()
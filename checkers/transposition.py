@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Transposition table for checkers.ai keyed by Board.get_hash.
+"""
+import sys
+from collections import namedtuple
+
+DEFAULT_MAX_MEMORY = 16 * 1024 * 1024     # bytes
+
+
+TableEntry = namedtuple('TableEntry', 'key depth bound score move generation')
+
+
+def _measure_entry_size():
+    """
+    return bytes of one stored entry: tuple, 64-bit key, score, packed move (see checkers.ai.pack_path),
+    generation and list slot, small depth and bound are shared ints
+    """
+    entry = TableEntry((1 << 64) - 1, 1, 0, 1000, 1 << 30, 1000)
+    return (sys.getsizeof(entry) + sum(sys.getsizeof(item) for item in (entry.key, entry.score, entry.move,
+                                                                        entry.generation)) +
+            sys.getsizeof([None]) - sys.getsizeof([]))
+
+
+ENTRY_SIZE = _measure_entry_size()
+
+
+class TranspositionTable(object):
+    class BOUND:
+        EXACT = 0
+        LOWER = 1   # score is at least entry score
+        UPPER = 2   # score is at most entry score
+
+    class REPLACE:
+        ALWAYS = 'always'
+        DEPTH = 'depth'     # keep deeper entries of the current generation
+
+    def __init__(self, max_memory=DEFAULT_MAX_MEMORY, replace=REPLACE.DEPTH):
+        assert replace in (self.REPLACE.ALWAYS, self.REPLACE.DEPTH)
+
+        self.size = max(1, max_memory // ENTRY_SIZE)
+        self.replace = replace
+        self.generation = 0
+        self._entries = [None] * self.size
+
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0     # slot taken by other position
+        self.stores = 0
+        self.filled = 0
+
+    def new_search(self):
+        """
+        Mark entries stored before as old, so they are replaced first.
+        """
+        self.generation += 1
+
+    def probe(self, key):
+        entry = self._entries[key % self.size]
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.key != key:
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def store(self, key, depth, bound, score, move):
+        """
+        move: hashable id of the best move, checkers.ai stores MovePath.path packed to int
+        """
+        index = key % self.size
+        entry = self._entries[index]
+        if entry is None:
+            self.filled += 1
+        elif (self.replace == self.REPLACE.DEPTH and entry.key != key and
+              entry.generation == self.generation and entry.depth > depth):
+            return
+
+        if move is None and entry is not None and entry.key == key:
+            move = entry.move
+
+        self._entries[index] = TableEntry(key, depth, bound, score, move, self.generation)
+        self.stores += 1
+
+    def clear(self):
+        self._entries = [None] * self.size
+        self.filled = 0
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'filled': self.filled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'stores': self.stores,
+        }
+
+    def __str__(self):
+        return 'TT %(filled)d/%(size)d, hits: %(hits)d, misses: %(misses)d, collisions: %(collisions)d' % self.stats()
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from qt import Qt, QRectF, QWidget, QPainter, QBrush, QPen, QColor, Signal, QObject, QSize
+from qt import Qt, QRectF, QWidget, QPainter, QPixmap, QBrush, QPen, QColor, Signal, QObject, QSize
 
 from checkers.logic import get_available_fields_for_checker
 from checkers.models import Checker
@@ -25,7 +25,9 @@ class BoardWidget(QWidget):
         self.board = board
 
         self._selected_field = None     # (x_field, y_field) or None
-        self._available_moves = []      # [(x_field, y_field), ...] or None
+        self._available_moves = frozenset()     # {(x_field, y_field), ...}
+        self._field_states = self.get_field_states()    # checkers painted last time, see update_board
+        self._static_pixmap = None      # background, border and empty fields, rebuilt on resize
         self._painter = QPainter()
 
         self._background_brush = QBrush(Qt.gray)
@@ -49,16 +51,39 @@ class BoardWidget(QWidget):
     def set_selected_field(self, field):
         assert field is None or len(field) == 2
 
+        if field != self._selected_field:
+            self.update_fields(filter(None, (self._selected_field, field)))
         self._selected_field = field
 
     def set_available_moves(self, fields):
-        assert all(len(field) == 2 for field in fields) or fields is None
-
-        if not fields:
-            self._available_moves = []
+        assert fields is None or all(len(field) == 2 for field in fields)
 
+        fields = frozenset(fields or ())
+        self.update_fields(fields ^ self._available_moves)
         self._available_moves = fields
 
+    def get_field_states(self):
+        """
+        return {(x_field, y_field): (color, is_king)} of checkers on board
+        """
+        return dict(((checker.x, checker.y), (checker.color, checker.is_king)) for checker in self.board.checkers)
+
+    def update_board(self):
+        """
+        Schedule repaint of fields changed since the previous call, used instead of repaint() after moves.
+        """
+        field_states = self.get_field_states()
+        changed_items = set(field_states.iteritems()) ^ set(self._field_states.iteritems())
+        self.update_fields(set(field for field, _ in changed_items))
+        self._field_states = field_states
+
+    def update_fields(self, fields):
+        if self._field_size is None:
+            return      # nothing is painted before the first resize
+
+        for x_field, y_field in fields:
+            self.update(self.field_rect(x_field, y_field).toAlignedRect())
+
     def board_rect(self):
         rect = self.rect()
         size = min([rect.width(), rect.height()]) - self._border_size * 2
@@ -84,6 +109,13 @@ class BoardWidget(QWidget):
         self._field_size = outer_size / float(self.board.SIZE + 2 * self.BORDER_SIZE_TO_FIELD)
         self._border_size = self._field_size * self.BORDER_SIZE_TO_FIELD
 
+        self._static_pixmap = QPixmap(rect.size())
+        self._painter.begin(self._static_pixmap)
+        self.draw_background()
+        self.draw_border()
+        self.draw_fields()
+        self._painter.end()
+
     def mousePressEvent(self, event):
         clicked_field = self.get_field_by_point(event.pos())
         if clicked_field:
@@ -91,12 +123,12 @@ class BoardWidget(QWidget):
         return super(BoardWidget, self).mousePressEvent(event)
 
     def paintEvent(self, event):
+        dirty_rect = event.rect()
         self._painter.begin(self)
 
-        self.draw_background()
-        self.draw_border()
-        self.draw_fields()
-        self.draw_checkers()
+        self._painter.drawPixmap(dirty_rect, self._static_pixmap, dirty_rect)
+        self.draw_highlighted_fields(QRectF(dirty_rect))
+        self.draw_checkers(QRectF(dirty_rect))
 
         self._painter.end()
 
@@ -129,21 +161,29 @@ class BoardWidget(QWidget):
     def draw_fields(self):
         for x_field in xrange(self.board.SIZE):
             for y_field in xrange(self.board.SIZE):
-                if (x_field, y_field) == self._selected_field:
-                    brush = self._selected_field_brush
-                elif (x_field, y_field) in self._available_moves:
-                    brush = self._available_move_field_brush
-                elif self.board.is_black_field(x_field, y_field):
+                if self.board.is_black_field(x_field, y_field):
                     brush = self._black_field_brush
                 else:
                     brush = self._white_field_brush
                 self.draw_field(x_field, y_field, brush)
 
+    def draw_highlighted_fields(self, dirty_rect):
+        for field in self._available_moves:
+            if self.field_rect(*field).intersects(dirty_rect):
+                self.draw_field(field[0], field[1], self._available_move_field_brush)
+
+        if self._selected_field and self.field_rect(*self._selected_field).intersects(dirty_rect):
+            self.draw_field(self._selected_field[0], self._selected_field[1], self._selected_field_brush)
+
     def draw_field(self, x_field, y_field, brush):
         self._painter.fillRect(self.field_rect(x_field, y_field), brush)
 
-    def draw_checkers(self):
+    def draw_checkers(self, dirty_rect):
         for checker in self.board.checkers:
+            field_rect = self.field_rect(checker.x, checker.y)
+            if not field_rect.intersects(dirty_rect):
+                continue
+
             if checker.color == Checker.BLACK:
                 if checker.is_king:
                     brush = self._black_king_checker_brush
@@ -161,7 +201,6 @@ class BoardWidget(QWidget):
 
             self._painter.setBrush(brush)
             self._painter.setPen(pen)
-            field_rect = self.field_rect(checker.x, checker.y)
             radius = self._field_size / 2.0 * self.CHECKER_SIZE_TO_FIELD
             self._painter.drawEllipse(field_rect.center(), radius, radius)
 
@@ -173,6 +212,7 @@ class BoardController(QObject):
         super(BoardController, self).__init__(parent=widget)
         self.board = board
         self.widget = widget
+        self.game = None    # checkers.logic.Game of board, its moves are shown for the player to move
         self._player_color = None
         self._selected_field = None
         self._can_move_checkers = False
@@ -183,6 +223,9 @@ class BoardController(QObject):
     def connect_signals(self):
         self.widget.field_clicked.connect(self.process_field_clicked)
 
+    def set_game(self, game):
+        self.game = game
+
     def set_player_color(self, player_color):
         self._player_color = player_color
 
@@ -192,7 +235,7 @@ class BoardController(QObject):
 
     def process_field_clicked(self, button, x_field, y_field):
         self._field_clicked(button, (x_field, y_field))
-        self.widget.repaint()
+        self.widget.update_board()
 
     def _field_clicked(self, button, clicked_field):
         if button == Qt.LeftButton:
@@ -220,7 +263,9 @@ class BoardController(QObject):
             return
 
         selected_checker = self.board.get_checker_in_position(*self._selected_field)
-        if selected_checker:
+        if selected_checker and self.game and selected_checker.color == self.game.current_player.color:
+            available_moves = self.game.get_available_fields(*self._selected_field)
+        elif selected_checker:
             available_moves = get_available_fields_for_checker(self.board, selected_checker)
         else:
             available_moves = ()
@@ -244,7 +289,7 @@ class BoardEditorController(BoardController):
                 if answer == self.MAKE_KING:
                     checker.make_king()
                 elif answer == self.MAKE_NOT_KING:
-                    checker.is_king = False
+                    checker.make_king(False)
                 elif answer == self.REMOVE:
                     self.board.remove_checker(checker)
             else:
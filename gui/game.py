@@ -1,16 +1,23 @@
 # -*- coding: utf-8 -*-
 import json
+import os
+from copy import deepcopy
 
-from qt import QObject, QMessageBox, Signal
+from qt import QObject, QMessageBox, QThread, Signal
 
-from checkers.ai import calculate_ai_move
-from checkers.logic import Game, GameError
+import settings
+from checkers.ai import Search, MAX_DEPTH, get_moves, log_search_stats
+from checkers.book import OpeningBook
+from checkers.logic import Game, GameError, apply_move_path
 from checkers.models import Checker
+from checkers.parallel import ParallelSearch
+from checkers.tablebase import Tablebase
 
 
 class GameController(QObject):
     move_logged = Signal(str)
     score_updated = Signal(int, int)
+    ai_progress = Signal(str)
 
     def __init__(self, game_file_name, parent=None):
         super(GameController, self).__init__(parent=parent)
@@ -22,12 +29,18 @@ class GameController(QObject):
             self.board_controller.checker_moved.disconnect(self.process_checker_moved)
         self.board_controller = board_controller
         self.board_controller.checker_moved.connect(self.process_checker_moved)
+        self.board_controller.set_game(self.game)
         board_controller.set_player_color(Checker.WHITE)
         self.start()
 
     def start(self):
         pass
 
+    def stop(self):
+        """
+        Called when game is replaced by a new one.
+        """
+
     def process_checker_moved(self, x1, y1, x2, y2):
         checker = self.game.board.get_checker_in_position(x1, y1)
         if not checker:
@@ -39,13 +52,13 @@ class GameController(QObject):
         except GameError, e:
             self.message('Wrong', str(e))
 
-        self.board_controller.widget.repaint()
+        self.board_controller.widget.update_board()
 
         self.score_updated.emit(self.game.white_player.score, self.game.black_player.score)
 
         self._process_checker_moved(checker, x2, y2)
 
-        winner = self.game.board.get_winner()
+        winner = self.game.get_winner()
         if winner:
             self.on_game_end(winner)
 
@@ -70,11 +83,64 @@ class TwoPlayersGameController(GameController):
         self.board_controller.set_can_move_checkers(True)
 
 
+class AIWorker(QThread):
+    """
+    Searches ai move in background on a copy of board.
+    """
+    progress = Signal(object)           # SearchResult of the last completed iteration
+    search_finished = Signal(object)    # SearchResult
+
+    def __init__(self, board, color, transposition_table, book=None, tablebase=None, pondering=False,
+                 parallel_search=None, parent=None):
+        """
+        pondering: search limited by settings.AI_PONDER_TIME_LIMIT, given the usual limit by search.set_time_limit
+        when its position is reached
+        parallel_search: checkers.parallel.ParallelSearch used instead of search, with the same board and limits
+        """
+        super(AIWorker, self).__init__(parent)
+        self.color = color
+        self.parallel_search = parallel_search
+        time_limit = settings.AI_PONDER_TIME_LIMIT if pondering else settings.AI_TIME_LIMIT
+        self.search = Search(deepcopy(board), transposition_table, time_limit=time_limit,
+                             progress_callback=self.progress.emit, book=book, tablebase=tablebase,
+                             trace_callback=log_search_stats)
+
+    def run(self):
+        max_depth = settings.AI_MAX_DEPTH or MAX_DEPTH
+        if self.parallel_search:
+            result = self.parallel_search.iterative_deepening(self.search.board, self.color, max_depth,
+                                                              time_limit=self.search.time_limit,
+                                                              progress_callback=self.progress.emit,
+                                                              book=self.search.book)
+        else:
+            result = self.search.iterative_deepening(self.color, max_depth)
+        self.search_finished.emit(result)
+
+    def cancel(self):
+        (self.parallel_search or self.search).stop()
+        self.wait()
+
+
 class OnePlayerGameController(GameController):
     def __init__(self, game_file_name, player_color, parent=None):
         super(OnePlayerGameController, self).__init__(game_file_name, parent)
         self.player_color = player_color
         self.ai_color = Checker.WHITE if player_color == Checker.BLACK else Checker.BLACK
+        self._ai_worker = None
+        # search of the position expected after the player's reply, made while the player is thinking
+        self._ponder_worker = None
+        self._ponder_key = None     # hash of the expected position
+        self._ponder_result = None  # SearchResult if ponder search has finished by itself
+        self._book = None
+        if settings.AI_BOOK_FILENAME and os.path.exists(settings.AI_BOOK_FILENAME):
+            self._book = OpeningBook(settings.AI_BOOK_FILENAME)
+        self._tablebase = None
+        if settings.AI_TABLEBASE_DIRECTORY and os.path.isdir(settings.AI_TABLEBASE_DIRECTORY):
+            self._tablebase = Tablebase(settings.AI_TABLEBASE_DIRECTORY)
+        self._parallel_search = None
+        if settings.AI_PROCESSES > 1:
+            self._parallel_search = ParallelSearch(settings.AI_PROCESSES,
+                                                   settings.AI_TABLEBASE_DIRECTORY if self._tablebase else None)
 
     def set_board_controller(self, board_controller):
         super(OnePlayerGameController, self).set_board_controller(board_controller)
@@ -86,22 +152,142 @@ class OnePlayerGameController(GameController):
         if self.ai_color == Checker.WHITE:
             self._make_ai_moves()
 
+    def stop(self):
+        self._cancel_pondering()
+        if self._ai_worker:
+            worker, self._ai_worker = self._ai_worker, None
+            worker.cancel()
+            worker.deleteLater()
+        if self._parallel_search:
+            self._parallel_search.close()
+            self._parallel_search = None
+        # book and tablebase files are mapped to memory, a new game opens them again
+        if self._book:
+            self._book.close()
+            self._book = None
+        if self._tablebase:
+            self._tablebase.close()
+            self._tablebase = None
+
     def _process_checker_moved(self, checker, x, y):
         self._make_ai_moves()
 
     def _make_ai_moves(self):
+        if self.game.current_player.color != self.ai_color or self._ai_worker or self.game.get_winner():
+            return
+
         self.board_controller.set_can_move_checkers(False)
 
-        while self.game.current_player.color == self.ai_color:
-            move_coords = calculate_ai_move(self.game.board, self.ai_color, self.player_color)
-            if not move_coords:
-                self.move_logged.emit('ai has skipped turn')
-                break
-            checker = self.game.board.get_checker_in_position(move_coords[0], move_coords[1])
-            move = self.game.current_player.move(checker, move_coords[2], move_coords[3])
+        if self._ponder_worker and self._ponder_key == self.game.board.get_hash(self.ai_color):
+            self._use_ponder_worker()
+            return
+        self._cancel_pondering()
+
+        self._ai_worker = AIWorker(self.game.board, self.ai_color, self.game.transposition_table, self._book,
+                                   self._tablebase, parallel_search=self._parallel_search, parent=self)
+        self._ai_worker.progress.connect(self.process_ai_progress)
+        self._ai_worker.search_finished.connect(self.process_ai_move)
+        self._ai_worker.start()
+
+    def process_ai_progress(self, result):
+        if self._ai_worker is None or not result.move:
+            return
+
+        self.ai_progress.emit('ai thinking: %s' % (result.stats or result))
+
+    def process_ai_move(self, result):
+        if self._ai_worker is None:
+            # search was cancelled
+            return
+
+        worker, self._ai_worker = self._ai_worker, None
+        worker.wait()
+        # finished worker keeps its board copy and search, it is deleted instead of living as child of controller
+        worker.deleteLater()
+        # book hit rate of the game is shown until the next search
+        self.ai_progress.emit(str(self._book) if self._book else '')
+
+        if not result.move:
+            self.move_logged.emit('ai has skipped turn')
+            self._finish_ai_moves()
+            return
+
+        for x1, y1, x2, y2 in result.move.hops:
+            checker = self.game.board.get_checker_in_position(x1, y1)
+            move = self.game.current_player.move(checker, x2, y2)
             self.move_logged.emit('%s: %s' % (move, checker))
+        # one line summary of the last completed iteration
+        self.move_logged.emit('ai: %s, %s' % (result.move, result.stats or result))
+
+        self.board_controller.widget.update_board()
+        self.score_updated.emit(self.game.white_player.score, self.game.black_player.score)
 
+        winner = self.game.get_winner()
+        if winner:
+            self.on_game_end(winner)
+        elif self.game.current_player.color == self.ai_color:
+            self._make_ai_moves()
+            return
+        else:
+            self._start_pondering(result)
+
+        self._finish_ai_moves()
+
+    def _start_pondering(self, result):
+        """
+        Search for the ai answer to the player's reply predicted by principal variation of the last search.
+        """
+        if not settings.AI_PONDER or not result.stats or len(result.stats.principal_variation) < 2:
+            return
+
+        predicted_move = result.stats.principal_variation[1]
+        if predicted_move not in get_moves(self.game.board, self.player_color):
+            return
+
+        board = deepcopy(self.game.board)
+        apply_move_path(board, predicted_move)
+        self._ponder_key = board.get_hash(self.ai_color)
+        self._ponder_result = None
+        self._ponder_worker = AIWorker(board, self.ai_color, self.game.transposition_table, self._book,
+                                       self._tablebase, pondering=True, parent=self)
+        self._ponder_worker.search_finished.connect(self.process_ponder_finished)
+        self._ponder_worker.start()
+
+    def _use_ponder_worker(self):
+        """
+        The player has made the predicted move: play ponder result at once or let ponder search go on
+        until the time limit counted from its start.
+        """
+        worker, self._ponder_worker = self._ponder_worker, None
+        self._ai_worker = worker
+        self._ai_worker.progress.connect(self.process_ai_progress)
+        if self._ponder_result:
+            result, self._ponder_result = self._ponder_result, None
+            self.process_ai_move(result)
+        else:
+            worker.search.set_time_limit(settings.AI_TIME_LIMIT)
+
+    def _cancel_pondering(self):
+        # the table keeps what ponder search has found, so only the search itself is lost
+        if self._ponder_worker:
+            worker, self._ponder_worker = self._ponder_worker, None
+            worker.cancel()
+            worker.deleteLater()
+        self._ponder_result = None
+
+    def process_ponder_finished(self, result):
+        worker = self.sender()
+        if worker is self._ai_worker:
+            # the player has made the predicted move while ponder search was running
+            self.process_ai_move(result)
+        elif worker is self._ponder_worker:
+            self._ponder_result = result
+
+    def _finish_ai_moves(self):
         self.board_controller.set_can_move_checkers(True)
+        self.board_controller.set_player_color(self.player_color)
+        self.board_controller.select_field()
+        self.board_controller.widget.update_board()
 
 
 class TrainingGameController(OnePlayerGameController):
@@ -90,6 +90,9 @@ class Window(QMainWindow, Ui_MainWindow):
     def append_to_move_log(self, msg):
         self.log_widget.appendPlainText(msg)
 
+    def show_status(self, msg):
+        self.statusbar.showMessage(msg)
+
     def set_score(self, white, black):
         msg = '%d:%d' % (white, black)
         self.lcd_widget.display(msg.center(5))
@@ -105,6 +108,7 @@ class WindowController(QObject):
         self.window = window
 
         self._board_controller_id = None
+        self.game_controller = None
 
         self.create_game()
         self.connect_signals()
@@ -135,6 +139,9 @@ class WindowController(QObject):
 
     def create_game(self, file_name=None, game_type=None):
         game_type = game_type or show_dialog(GAME_TYPE.ORDERING, message='Choose game type', title='New game')
+        if self.game_controller:
+            self.game_controller.stop()
+
         contoller_cls = GAME_TYPE.CONTROLLERS[game_type]
         if game_type == GAME_TYPE.ONE_PLAYER:
             color = ask_checker_color('Choose your color:')
@@ -150,6 +157,7 @@ class WindowController(QObject):
 
         self.game_controller.move_logged.connect(self.window.append_to_move_log)
         self.game_controller.score_updated.connect(self.window.set_score)
+        self.game_controller.ai_progress.connect(self.window.show_status)
 
     def create_board_widget(self, game_controller, controller_id=None):
         if not controller_id:
@@ -1,3 +1,11 @@
 # -*- coding: utf-8 -*-
 
 EDITOR_MODE = False
+
+AI_MAX_DEPTH = None     # None for no limit
+AI_TIME_LIMIT = 2.0     # seconds per ai move
+AI_PROCESSES = 1        # more than 1 for root-parallel search, see checkers.parallel
+AI_PONDER = True        # search on the player's time for the predicted reply
+AI_PONDER_TIME_LIMIT = 10.0     # seconds, ponder thread holds the interpreter lock while the gui waits for the player
+AI_BOOK_FILENAME = 'boards/default.book'     # used if exists, see checkers.book
+AI_TABLEBASE_DIRECTORY = 'tablebase'    # used if exists, see checkers.tablebase